@@ -0,0 +1,352 @@
+import sys
+import os
+import time
+import json
+import random
+import shutil
+import platform
+import tempfile
+import threading
+import statistics
+import argparse
+
+# 在匯入 PyQt6 之前指定無視窗平台，可在沒有螢幕的機器 (CI) 上執行
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PIL import Image, ImageDraw, features
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QRectF, QSettings, PYQT_VERSION_STR
+
+import shopee_tool as st
+
+# --- 效能測試：拼接/預覽、選取框重繪、縮圖、輸出 ---
+# python benchmark.py                  執行並與 benchmark_baseline.json 比較，有退步時回傳 1
+# python benchmark.py --update-baseline 以本次結果更新基準
+# python benchmark.py --quick          只跑小型資料集
+
+BASELINE_FILE = "benchmark_baseline.json"
+# 預設退步門檻：時間/記憶體超過基準的比例，且差距大於最小值才算 (避免極短的項目因雜訊誤判)
+# 記憶體比較的是項目執行期間相對於開始時的增量 (mem_mb)，不含 Qt 與先前項目已佔用的部分
+DEFAULT_THRESHOLDS = {"seconds": 0.25, "mem_mb": 0.20, "min_seconds": 0.005, "min_mb": 8}
+
+# 合成商品圖組：(名稱, 張數, 高度範圍, 格式)；寬度混合，預覽/輸出都會經過縮放
+SCENARIOS = [
+    ("small", 8, (800, 1500), ("jpg",)),
+    ("medium", 30, (1000, 3000), ("jpg", "png")),
+    ("large", 100, (1200, 3000), ("jpg", "png", "webp")),
+]
+QUICK_SCENARIOS = ("small", "medium")
+SOURCE_WIDTHS = (750, 790, 800, 1000, 1242)
+OVERLAY_BANDS = 100
+OVERLAY_FRAMES = 200
+
+
+# --- 合成圖片：色塊 + 雜訊區 (類似商品描述圖的橫條版面)，以固定亂數種子產生 ---
+def make_product_set(directory, count, heights, formats, seed=0):
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        w, h = rng.choice(SOURCE_WIDTHS), rng.randint(*heights)
+        img = Image.new("RGB", (w, h), (255, 255, 255))
+        draw = ImageDraw.Draw(img)
+        y = 0
+        while y < h:
+            band = rng.randint(20, 300)
+            if rng.random() < 0.3:
+                noise = Image.effect_noise((w, band), 50).convert("RGB")
+                img.paste(noise, (0, y))
+            elif rng.random() < 0.7:
+                color = tuple(rng.randint(0, 255) for _ in range(3))
+                draw.rectangle([rng.randint(0, 40), y, w - rng.randint(0, 40), y + band], fill=color)
+            y += band
+        fmt = formats[i % len(formats)]
+        path = os.path.join(directory, f"item_{i:03d}.{fmt}")
+        if fmt == "jpg":
+            img.save(path, "JPEG", quality=90)
+        elif fmt == "webp":
+            img.save(path, "WEBP", quality=90)
+        else:
+            img.save(path, "PNG", compress_level=1)
+        paths.append(path)
+    return paths
+
+
+# --- 記憶體：背景執行緒取樣常駐記憶體 (RSS)，記錄區間內的峰值與相對於進入時的增量 ---
+def current_rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakMemory:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            rss = current_rss()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    @property
+    def growth(self):
+        if self.start is None or self.peak is None: return None
+        return self.peak - self.start
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# --- 無視窗驅動 MainWindow ---
+class Harness:
+    def __init__(self, app):
+        self.app = app
+        # 設定檔寫到暫存目錄，不影響使用者的設定 (Windows 的登錄檔不受影響，測試中也不寫入設定)
+        self.settings_dir = tempfile.mkdtemp(prefix="azrael_bench_settings_")
+        QSettings.setPath(QSettings.Format.NativeFormat, QSettings.Scope.UserScope, self.settings_dir)
+        self.window = st.MainWindow()
+        self.window.resize(1600, 1000)
+        self.window.show()
+        # 固定選項，不論使用者平常的設定為何都以相同條件測試
+        for box, checked in ((self.window.chk_smart_cuts, False), (self.window.chk_skip_dups, True),
+                             (self.window.chk_size_limit, False)):
+            box.blockSignals(True)
+            box.setChecked(checked)
+            box.blockSignals(False)
+
+    def wait_preview(self):
+        w = self.window
+        while w.preview_timer.isActive() or w.preview_job is not None:
+            self.app.processEvents()
+            time.sleep(0.001)
+        self.app.processEvents()
+
+    def load(self, paths):
+        w = self.window
+        w.clear_all()
+        w.add_images_to_list(paths)
+        # 略過 50ms 的合併延遲，直接開始讀圖
+        w.preview_timer.stop()
+        w.start_preview_job()
+        self.wait_preview()
+
+    def close(self):
+        self.window.close()
+        shutil.rmtree(self.settings_dir, ignore_errors=True)
+
+
+# --- 測試項目：每個函式執行一次並回傳 (秒數, 操作次數) ---
+def case_preview_cold(h, paths):
+    t0 = time.perf_counter()
+    h.load(paths)
+    return time.perf_counter() - t0, 1
+
+
+def case_preview_reorder(h, paths):
+    # 來源已在快取中：把最後一張移到最前面，只重新拼接
+    w = h.window
+    item = w.file_list.takeItem(w.file_list.count() - 1)
+    w.file_list.insertItem(0, item)
+    t0 = time.perf_counter()
+    w.start_preview_job()
+    h.wait_preview()
+    return time.perf_counter() - t0, 1
+
+
+def band_selections(height, count=OVERLAY_BANDS):
+    step = height / count
+    return [QRectF(0, i * step, st.TARGET_WIDTH, step * 0.8) for i in range(count)]
+
+
+def case_overlay_drag(h, paths):
+    # 模擬拖曳中段的選取框：每一幀移動一次並重繪
+    canvas = h.window.canvas
+    canvas.selections = band_selections(canvas.image_height)
+    canvas.refresh_overlays()
+    index = OVERLAY_BANDS // 2
+    t0 = time.perf_counter()
+    for i in range(OVERLAY_FRAMES):
+        top, bottom = canvas.model.span(index)
+        dy = 1 if i % 2 else -1
+        index = canvas.model.set(index, top + dy, bottom + dy)
+        canvas.refresh_overlays()
+    return time.perf_counter() - t0, OVERLAY_FRAMES
+
+
+def case_minimap_update(h, paths):
+    w = h.window
+    rects = band_selections(w.stitched_image.height)
+    t0 = time.perf_counter()
+    for i in range(OVERLAY_FRAMES):
+        rects[OVERLAY_BANDS // 2].moveTop(rects[OVERLAY_BANDS // 2].top() + (1 if i % 2 else -1))
+        w.minimap.update_data(w.stitched_image, [(r.top(), r.bottom()) for r in rects])
+        w.minimap.repaint()
+    return time.perf_counter() - t0, OVERLAY_FRAMES
+
+
+def run_export(h, max_bytes):
+    w = h.window
+    out_dir = tempfile.mkdtemp(prefix="azrael_bench_out_")
+    try:
+        # 與 start_export_job 相同：輸出品質的快取重新以 LANCZOS 解碼
+        cache = st.NormalizedImageCache(st.EXPORT_CACHE_MB * 1024 * 1024)
+        stitched = w.stitched_image.with_cache(cache)
+        t0 = time.perf_counter()
+        st.export_sliced(stitched, [(0, stitched.height)], out_dir, "Bench", None, w.encode_workers, max_bytes)
+        return time.perf_counter() - t0, 1
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def case_export_sliced(h, paths):
+    return run_export(h, None)
+
+
+def case_export_size_limit(h, paths):
+    return run_export(h, st.SIZE_LIMIT_KB * 1024 // 4)
+
+
+CASES = [
+    ("preview_cold", case_preview_cold),
+    ("preview_reorder", case_preview_reorder),
+    ("overlay_drag", case_overlay_drag),
+    ("minimap_update", case_minimap_update),
+    ("export_sliced", case_export_sliced),
+    ("export_size_limit", case_export_size_limit),
+]
+
+
+def run_suite(scenarios, repeat=3, work_dir=None):
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="azrael_bench_")
+    h = Harness(app)
+    results = {}
+    try:
+        for name, count, heights, formats in SCENARIOS:
+            if name not in scenarios: continue
+            set_dir = os.path.join(work_dir, name)
+            os.makedirs(set_dir, exist_ok=True)
+            paths = make_product_set(set_dir, count, heights, formats)
+            h.load(paths)
+            print(f"[{name}] {count} 張, 長圖 {h.window.stitched_image.height} px")
+            for case, fn in CASES:
+                runs = []
+                growth = peak = 0
+                for _ in range(repeat):
+                    with PeakMemory() as mem:
+                        seconds, ops = fn(h, paths)
+                    runs.append(seconds)
+                    growth = max(growth, mem.growth or 0)
+                    peak = max(peak, mem.peak or 0)
+                seconds = statistics.median(runs)
+                entry = {"seconds": round(seconds, 4), "runs": [round(r, 4) for r in runs], "ops": ops,
+                         "mem_mb": round(growth / (1024 * 1024), 1), "rss_peak_mb": round(peak / (1024 * 1024), 1)}
+                if ops > 1:
+                    entry["ms_per_op"] = round(seconds * 1000 / ops, 3)
+                results[f"{name}/{case}"] = entry
+                extra = f"  ({entry['ms_per_op']} ms/次)" if ops > 1 else ""
+                print(f"  {case:<18s} {seconds:8.3f}s  記憶體 +{entry['mem_mb']:6.1f} MB (峰值 {entry['rss_peak_mb']:.1f} MB){extra}")
+    finally:
+        h.close()
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {"meta": environment_info(repeat), "results": results}
+
+
+def environment_info(repeat):
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count(), "pillow": Image.__version__,
+            "pyqt": PYQT_VERSION_STR, "webp": features.check("webp"), "repeat": repeat}
+
+
+# --- 與基準比較：回傳 [(項目, 指標, 基準值, 本次值)] ---
+def compare(results, baseline, thresholds):
+    regressions = []
+    base_results = baseline.get("results", {})
+    for key, entry in results.items():
+        base = base_results.get(key)
+        if base is None: continue
+        for metric, slack in (("seconds", thresholds["min_seconds"]), ("mem_mb", thresholds["min_mb"])):
+            old, new = base.get(metric), entry.get(metric)
+            if old is None or new is None: continue
+            if new > old * (1 + thresholds[metric]) and new - old > slack:
+                regressions.append((key, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shopee 拼圖工具效能測試")
+    parser.add_argument("--quick", action="store_true", help=f"只跑 {', '.join(QUICK_SCENARIOS)} 資料集")
+    parser.add_argument("--scenarios", help="要執行的資料集 (逗號分隔)")
+    parser.add_argument("--repeat", type=int, default=3, help="每個項目重複次數 (取中位數)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基準 JSON 路徑")
+    parser.add_argument("--update-baseline", action="store_true", help="以本次結果覆寫基準")
+    parser.add_argument("--threshold", type=float, help="時間退步門檻 (比例，預設依基準檔或 0.25)")
+    parser.add_argument("-o", "--output", help="本次結果 JSON 輸出路徑")
+    args = parser.parse_args(argv)
+
+    if args.scenarios:
+        scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    elif args.quick:
+        scenarios = list(QUICK_SCENARIOS)
+    else:
+        scenarios = [name for name, *_ in SCENARIOS]
+
+    report = run_suite(scenarios, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if baseline:
+        thresholds.update(baseline.get("thresholds", {}))
+    if args.threshold is not None:
+        thresholds["seconds"] = args.threshold
+
+    if args.update_baseline:
+        # 保留既有基準中未執行的項目 (例如 --quick 時的 large)
+        merged = dict(baseline.get("results", {})) if baseline else {}
+        merged.update(report["results"])
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": report["meta"], "thresholds": thresholds, "results": merged},
+                      f, ensure_ascii=False, indent=2)
+        print(f"已更新基準: {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"找不到基準 {args.baseline}，以 --update-baseline 建立")
+        return 0
+
+    regressions = compare(report["results"], baseline, thresholds)
+    for key, metric, old, new in regressions:
+        print(f"⚠️ 退步 {key} {metric}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    if not regressions:
+        print("✅ 沒有超過門檻的退步")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
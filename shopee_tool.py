@@ -1,15 +1,41 @@
+import time
+STARTUP_MARKS = [("start", time.perf_counter())]  # 啟動各階段的時間點 (--startup-profile)
 import sys
 import os
 import math
+import bisect
+import threading
+import io
+import json
+import hashlib
+import importlib
+import contextlib
+from collections import OrderedDict
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QListWidget, QPushButton, QLabel, QFileDialog, QSplitter, 
                              QScrollArea, QMessageBox, QFrame, QAbstractItemView, QGraphicsView, 
                              QGraphicsScene, QGraphicsPixmapItem, QGraphicsRectItem, QGraphicsLineItem,
-                             QGraphicsPathItem, QDialog, QMenu, QSizePolicy, QListWidgetItem, QLineEdit)
-from PyQt6.QtCore import Qt, QRectF, QSettings, QSize
+                             QGraphicsPathItem, QDialog, QMenu, QSizePolicy, QListWidgetItem, QLineEdit,
+                             QCheckBox, QSpinBox)
+from PyQt6.QtCore import (Qt, QRect, QRectF, QSettings, QSize, QObject, QRunnable, QThreadPool, QTimer,
+                          QStandardPaths, QFileSystemWatcher, pyqtSignal)
 from PyQt6.QtGui import (QPixmap, QImage, QDragEnterEvent, QDropEvent, QColor, QPen, QBrush, 
                          QPainter, QPainterPath, QIcon, QAction)
-from PIL import Image
+
+# --- 延遲載入模組：第一次存取屬性時才 import，之後全域名稱直接換成真正的模組 ---
+# PIL 在視窗第一次繪製後才需要，不拖慢啟動
+class LazyModule:
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+Image = LazyModule("PIL.Image", "Image")
+STARTUP_MARKS.append(("imports", time.perf_counter()))
 
 # --- 作者與角色資訊 ---
 APP_VERSION = "v1 Azrael Edition (Patch 5.6)"
@@ -23,6 +49,30 @@ TARGET_WIDTH = 800
 MAX_SLICE_HEIGHT = 1600 
 MAX_IMAGES = 12
 THUMB_WIDTH = 120 
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+TILE_HEIGHT = 1024  # 畫布分塊高度 (場景座標)
+TILE_CACHE_LIMIT = 24  # 畫面外最多保留的分塊 pixmap 數
+DECODE_WORKERS = os.cpu_count() or 1  # 平行解碼的執行緒數 (可由 QSettings 的 decode_workers 覆寫)
+ENCODE_WORKERS = os.cpu_count() or 1  # 平行輸出 JPEG 的執行緒數 (可由 QSettings 的 encode_workers 覆寫)
+JPEG_QUALITY = 95
+JPEG_MIN_QUALITY = 40  # 限制檔案大小時最低可接受的品質
+SIZE_LIMIT_KB = 2000  # 蝦皮單張圖片上傳上限 (預設值，可於介面調整)
+CACHE_BUDGET_MB = 512  # 正規化圖片快取的預設記憶體上限 (可由 QSettings 的 cache_budget_mb 覆寫)
+SMART_MIN_GAP = 40  # 智慧選取：高度超過此值的單色空白/分隔帶才會被移除 (可由 QSettings 的 smart_min_gap 覆寫)
+SMART_GAP_PAD = 8  # 移除空白帶時上下各保留的留白
+CUT_SEARCH_WINDOW = 240  # 智慧切線：每條切線從 1600px 處往上搜尋的範圍
+TRIM_BLOCK = 16  # 自動刪減：以此高度為單位挑選要刪除的區塊
+DUP_HASH_DISTANCE = 6  # 感知雜湊 (dHash) 的漢明距離不超過此值才列為重複候選，需 <= 7
+DUP_FINGERPRINT_DIFF = 8  # 候選再以 16x16 灰階縮圖確認：平均每像素差異不超過此值且高度相近
+DUP_DETAIL_SCALE = 5  # 最後以 1/5 大小的灰階圖逐像素比對 (800px 寬 -> 160px)，分得出文字內容不同的白底說明圖
+DUP_DETAIL_TOL = 32  # 逐像素比對時差異超過此值才算不同 (重新壓縮/縮放造成的差異在此之下)
+DUP_DETAIL_MISMATCH = 0.002  # 不同的像素比例不超過此值才視為近似重複
+PROFILE_LOG_BYTES = 1024 * 1024  # 效能記錄檔 (JSON lines) 單檔上限，超過時輪替
+PROFILE_LOG_BACKUPS = 3
+PROJECT_EXT = ".azproj"  # 專案檔 (JSON)：來源順序、指紋、偏移與選取區
+PROJECT_VERSION = 1
+EXPORT_CACHE_MB = 256  # 輸出時 LANCZOS 原圖重算的暫存上限
+WATCH_DELAY_MS = 500  # 來源檔被外部程式改動後，等寫入完成再重新讀圖
 
 # --- 資源路徑輔助 ---
 def resource_path(relative_path):
@@ -31,19 +81,1249 @@ def resource_path(relative_path):
     return os.path.join(os.path.abspath("."), relative_path)
 
 # --- 輔助函式：取得不重複的檔名 ---
-def get_unique_filename(directory, filename):
+# taken: 同一批次已預留的路徑，平行寫檔前先決定好所有檔名
+def get_unique_filename(directory, filename, taken=None):
     base, ext = os.path.splitext(filename)
     counter = 1
     new_filename = filename
     full_path = os.path.join(directory, new_filename)
     
-    while os.path.exists(full_path):
+    while os.path.exists(full_path) or (taken is not None and full_path in taken):
         new_filename = f"{base}_{counter}{ext}"
         full_path = os.path.join(directory, new_filename)
         counter += 1
         
+    if taken is not None:
+        taken.add(full_path)
     return full_path
 
+# --- 輔助函式：PIL 圖轉 QImage/QPixmap ---
+# PIL 的 RGB 圖內部每像素本來就是 4 bytes，tobytes("raw", "RGBX") 只是逐列複製一次，
+# QImage 直接使用這份資料 (不再 copy)，不經過 convert("RGBA") 的中間圖。
+# QImage 不擁有這塊記憶體，所以把資料掛在回傳的物件上，讓它和 QImage 一起存活
+def pil_to_qimage(pil_image):
+    w, h = pil_image.size
+    if pil_image.mode == "L":
+        fmt, bytes_per_pixel, rawmode = QImage.Format.Format_Grayscale8, 1, "L"
+    else:
+        if pil_image.mode not in ("RGB", "RGBX"):
+            pil_image = pil_image.convert("RGB")
+        fmt, bytes_per_pixel, rawmode = QImage.Format.Format_RGBX8888, 4, "RGBX"
+    if w == 0 or h == 0:
+        return QImage(w, h, fmt)
+    data = pil_image.tobytes("raw", rawmode)
+    if len(data) != w * h * bytes_per_pixel:
+        raise ValueError(f"unexpected buffer size {len(data)} for {w}x{h} {rawmode}")
+    qimage = QImage(data, w, h, w * bytes_per_pixel, fmt)
+    qimage.pil_data = data
+    return qimage
+
+def pil_to_pixmap(pil_image):
+    return QPixmap.fromImage(pil_to_qimage(pil_image))
+
+def pixmap_bytes(pixmap):
+    if pixmap is None or pixmap.isNull(): return 0
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:,.0f} {unit}"
+        n /= 1024
+    return f"{n:,.1f} GB"
+
+# --- 效能記錄：各操作 (op) 的分段耗時 ---
+# with PROFILER.span("preview", "decode"): ... 會把耗時累加到 preview 這次操作的 decode 階段；
+# begin(op)/end(op) 界定一次操作 (可跨執行緒)，結束時保留最近一次的分段結果並寫入輪替的 JSON lines 記錄檔。
+# 停用時 span() 直接回傳共用的空 context，幾乎沒有額外負擔
+_NO_SPAN = contextlib.nullcontext()
+
+class _Span:
+    __slots__ = ("profiler", "op", "stage", "t0")
+
+    def __init__(self, profiler, op, stage):
+        self.profiler, self.op, self.stage = profiler, op, stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.op, self.stage, time.perf_counter() - self.t0)
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.open = {}  # op -> [開始時間, {階段: 秒}]
+        self.last = OrderedDict()  # op -> 最近一次完成的結果 (最新的排在最後)
+        self.logger = None
+        self.log_path = None
+
+    def enable(self, log_path=None):
+        self.enabled = True
+        if log_path and self.logger is None:
+            import logging
+            from logging.handlers import RotatingFileHandler
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            handler = RotatingFileHandler(log_path, maxBytes=PROFILE_LOG_BYTES, backupCount=PROFILE_LOG_BACKUPS,
+                                          encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger = logging.getLogger("shopee_tool.profile")
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            self.logger.addHandler(handler)
+            self.log_path = log_path
+
+    def disable(self):
+        self.enabled = False
+        with self.lock:
+            self.open.clear()
+
+    def span(self, op, stage):
+        if not self.enabled: return _NO_SPAN
+        return _Span(self, op, stage)
+
+    @contextlib.contextmanager
+    def operation(self, op):
+        # 同一執行緒內開始並結束的操作
+        if not self.enabled:
+            yield
+            return
+        self.begin(op)
+        try:
+            yield
+        finally:
+            self.end(op)
+
+    def begin(self, op):
+        if not self.enabled: return
+        with self.lock:
+            self.open[op] = [time.perf_counter(), {}]
+
+    def add(self, op, stage, seconds):
+        with self.lock:
+            rec = self.open.get(op)
+            if rec is None: return
+            rec[1][stage] = rec[1].get(stage, 0.0) + seconds
+
+    def end(self, op, **info):
+        if not self.enabled: return
+        with self.lock:
+            rec = self.open.pop(op, None)
+            # 沒有任何階段的操作 (例如捲動時沒有新分塊) 不記錄
+            if rec is None or not (rec[1] or info): return
+            entry = {"op": op, "time": round(time.time(), 3),
+                     "total_ms": round((time.perf_counter() - rec[0]) * 1000, 3),
+                     "stages_ms": {k: round(v * 1000, 3) for k, v in rec[1].items()}}
+            entry.update(info)
+            self.last.pop(op, None)
+            self.last[op] = entry
+        if self.logger:
+            self.logger.info(json.dumps(entry, ensure_ascii=False))
+
+PROFILER = Profiler()
+
+# --- 輔助函式：開檔並正規化為 TARGET_WIDTH 寬的 RGB 圖 (輸出用，LANCZOS) ---
+def load_normalized_image(path):
+    with Image.open(path) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        w, h = img.size
+        scale = TARGET_WIDTH / w
+        new_h = int(h * scale)
+        return img.resize((TARGET_WIDTH, new_h), Image.Resampling.LANCZOS)
+
+# --- 輔助函式：快速預覽用的正規化 ---
+# JPEG 以 draft 模式在解碼時直接縮小，再用較便宜的濾鏡縮放；輸出尺寸以原圖尺寸計算，
+# 與 load_normalized_image 完全相同，兩種品質共用同一套座標，選取區可直接套用到輸出
+def load_preview_image(path):
+    with Image.open(path) as img:
+        w, h = img.size
+        new_h = int(h * (TARGET_WIDTH / w))
+        img.draft("RGB", (TARGET_WIDTH, new_h))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        return img.resize((TARGET_WIDTH, new_h), Image.Resampling.BILINEAR, reducing_gap=3.0)
+
+# --- 輔助函式：單張來源的縮圖 (右側 MiniMap 用) ---
+def make_source_thumb(img):
+    thumb_h = max(1, round(img.height * THUMB_WIDTH / TARGET_WIDTH))
+    return img.resize((THUMB_WIDTH, thumb_h), Image.Resampling.BILINEAR)
+
+# --- 輔助函式：圖片簽章 = 64-bit 感知雜湊 (dHash，比較左右相鄰像素的亮暗) + 16x16 灰階縮圖 + 1/5 灰階細節圖 ---
+# 另存檔名/重新壓縮/縮放過的同一張圖雜湊幾乎相同；橫條版面與白底文字圖的雜湊、縮圖都容易相同，
+# 所以最後以細節圖逐像素確認 (img 為正規化後 TARGET_WIDTH 寬的圖)
+def image_signature(img, size=8):
+    detail = img.reduce(DUP_DETAIL_SCALE).convert("L")
+    px = detail.resize((size + 1, size), Image.Resampling.BILINEAR).tobytes()
+    h = 0
+    for y in range(size):
+        row = px[y * (size + 1):(y + 1) * (size + 1)]
+        for x in range(size):
+            h = (h << 1) | (row[x] < row[x + 1])
+    return h, detail.resize((16, 16), Image.Resampling.BILINEAR).tobytes(), detail
+
+# 兩張細節圖中差異超過 DUP_DETAIL_TOL 的像素比例 (高度略有不同時先縮放成一樣大)
+def detail_mismatch(a, b):
+    from PIL import ImageChops
+    if b.size != a.size:
+        b = b.resize(a.size, Image.Resampling.BILINEAR)
+    hist = ImageChops.difference(a, b).histogram()
+    return sum(hist[DUP_DETAIL_TOL + 1:]) / max(1, a.width * a.height)
+
+# --- 感知雜湊索引 ---
+# 64-bit 雜湊切成 8 段 8-bit 分桶：漢明距離 <= 7 的兩個雜湊至少有一段完全相同 (鴿籠原理)，
+# 查詢只需比對同桶的候選，不必與所有圖片兩兩比較
+class ImageHashIndex:
+    BANDS = 8
+
+    def __init__(self, max_distance=DUP_HASH_DISTANCE, max_diff=DUP_FINGERPRINT_DIFF, max_mismatch=DUP_DETAIL_MISMATCH):
+        self.max_distance = max_distance
+        self.max_diff = max_diff
+        self.max_mismatch = max_mismatch
+        self.buckets = {}
+        self.entries = {}  # key -> (簽章, 高度)
+
+    def find(self, signature, height):
+        h, fingerprint, detail = signature
+        seen = set()
+        for band in range(self.BANDS):
+            for key in self.buckets.get((band, (h >> (band * 8)) & 0xFF), ()):
+                if key in seen: continue
+                seen.add(key)
+                (other, other_fp, other_detail), other_h = self.entries[key]
+                if (bin(h ^ other).count("1") <= self.max_distance
+                        and abs(height - other_h) <= 0.02 * max(height, other_h)
+                        and sum(abs(a - b) for a, b in zip(fingerprint, other_fp)) <= self.max_diff * len(fingerprint)
+                        and detail_mismatch(detail, other_detail) <= self.max_mismatch):
+                    return key
+        return None
+
+    def add(self, key, signature, height):
+        h = signature[0]
+        self.entries[key] = (signature, height)
+        for band in range(self.BANDS):
+            self.buckets.setdefault((band, (h >> (band * 8)) & 0xFF), []).append(key)
+
+# --- 正規化圖片快取 (LRU) ---
+# 以 (路徑, mtime, 檔案大小) 為 key，排序/刪除/拖曳時只需解碼新增或變更過的檔案
+# loader 決定解碼品質：預覽用 load_preview_image，輸出用 load_normalized_image
+class NormalizedImageCache:
+    def __init__(self, budget_bytes, loader=load_normalized_image):
+        self.loader = loader
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> [threading.Event, 解碼結果]：同一張圖同時被多個執行緒要求時只解碼一次
+
+    @staticmethod
+    def make_key(path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def image_bytes(img):
+        # PIL 的多通道圖 (RGB 等) 內部每像素固定 4 bytes
+        w, h = img.size
+        bands = len(img.getbands())
+        return w * h * (4 if bands >= 3 else bands)
+
+    def get(self, key):
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+            return img
+
+    def put(self, key, img):
+        with self._lock:
+            if key in self._entries:
+                self.used_bytes -= self.image_bytes(self._entries.pop(key))
+            self._entries[key] = img
+            self.used_bytes += self.image_bytes(img)
+            self._evict()
+
+    def load(self, path, key=None):
+        if key is None:
+            key = self.make_key(path)
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+                return img
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = [threading.Event(), None]
+        if not owner:
+            # 等待正在解碼的執行緒；它失敗時改由自己解碼
+            pending[0].wait()
+            if pending[1] is not None:
+                return pending[1]
+            return self.load(path, key)
+        try:
+            img = self.loader(path)
+            pending[1] = img
+            self.put(key, img)
+            return img
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending[0].set()
+
+    def set_budget(self, budget_bytes):
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict()
+
+    def _evict(self):
+        # 至少保留最新的一張，避免單張超大圖無法進入快取
+        while self.used_bytes > self.budget_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self.used_bytes -= self.image_bytes(old)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+# --- 平行解碼：多執行緒同時開檔/轉換/縮放 (Pillow 解碼與縮放時會釋放 GIL) ---
+# 回傳依 paths 順序排列的 (key, image)，不存在的檔案略過
+def decode_sources(cache, paths, workers=DECODE_WORKERS, report=None):
+    valid = [p for p in paths if p and os.path.exists(p)]
+    results = [None] * len(valid)
+
+    def work(i):
+        key = NormalizedImageCache.make_key(valid[i])
+        return key, cache.load(valid[i], key)
+
+    if workers <= 1 or len(valid) <= 1:
+        for i, path in enumerate(valid):
+            if report: report(i, len(valid), os.path.basename(path))
+            results[i] = work(i)
+        return results
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(work, i): i for i in range(len(valid))}
+        try:
+            for done, fut in enumerate(as_completed(futures)):
+                i = futures[fut]
+                results[i] = fut.result()
+                if report: report(done, len(valid), os.path.basename(valid[i]))
+        except BaseException:
+            # 取消或失敗時丟棄尚未開始的檔案，只等待執行中的幾張
+            for fut in futures:
+                fut.cancel()
+            raise
+    return results
+
+# --- 效能測試：平行解碼隨執行緒數的擴展性 (python shopee_tool.py --bench-decode [1,2,4,8]) ---
+def benchmark_decode(count=60, worker_counts=None):
+    import tempfile
+    import shutil
+    import random
+
+    if worker_counts is None:
+        worker_counts = sorted({1, 2, 4, 8, 16, DECODE_WORKERS})
+        worker_counts = [n for n in worker_counts if n <= max(DECODE_WORKERS, 1)]
+
+    tmp_dir = tempfile.mkdtemp(prefix="azrael_bench_")
+    try:
+        rng = random.Random(0)
+        paths = []
+        for i in range(count):
+            w, h = 790, rng.randint(1200, 3000)
+            noise = Image.effect_noise((w, h), 40)
+            img = Image.merge("RGB", (noise, noise.rotate(180), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+            path = os.path.join(tmp_dir, f"bench_{i:02d}.jpg")
+            img.save(path, "JPEG", quality=90)
+            paths.append(path)
+
+        results = []
+        base = None
+        print(f"decode {count} images ({os.cpu_count()} cores)")
+        for workers in worker_counts:
+            cache = NormalizedImageCache(1 << 40)
+            t0 = time.perf_counter()
+            decode_sources(cache, paths, workers)
+            elapsed = time.perf_counter() - t0
+            base = base or elapsed
+            results.append({"workers": workers, "seconds": round(elapsed, 3), "speedup": round(base / elapsed, 2)})
+            print(f"  workers={workers:<3d} {elapsed:7.3f}s  x{base / elapsed:.2f}")
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+# --- 切片計畫：每張輸出圖由哪些選取區片段 (長圖上的 y1, y2) 組成 ---
+# cuts: 切線在「保留高度」座標上的位置 (見 plan_cut_positions)；未指定時每 max_h 切一刀
+def plan_slices(intervals, max_h=MAX_SLICE_HEIGHT, cuts=None):
+    if cuts is None:
+        total = sum(int(y2) - int(y1) for y1, y2 in intervals)
+        cuts = range(max_h, total, max_h)
+    cuts = list(cuts)
+    slices = []
+    current = []
+    pos = 0
+    for y1, y2 in intervals:
+        y1, y2 = int(y1), int(y2)
+        while y2 > y1:
+            limit = cuts[len(slices)] if len(slices) < len(cuts) else math.inf
+            take = min(limit - pos, y2 - y1)
+            current.append((y1, y1 + take))
+            pos += take
+            y1 += take
+            if pos == limit:
+                slices.append(current)
+                current = []
+    if current:
+        slices.append(current)
+    return slices
+
+# --- 依切片計畫組出一張輸出圖 ---
+def render_slice(stitched_image, spans):
+    if len(spans) == 1:
+        y1, y2 = spans[0]
+        return stitched_image.crop((0, y1, TARGET_WIDTH, y2))
+    piece = Image.new("RGB", (TARGET_WIDTH, sum(y2 - y1 for y1, y2 in spans)))
+    curr_y = 0
+    for y1, y2 in spans:
+        piece.paste(stitched_image.crop((0, y1, TARGET_WIDTH, y2)), (0, curr_y))
+        curr_y += y2 - y1
+    return piece
+
+# --- JPEG 編碼 (記憶體內) ---
+def encode_jpeg(img, quality=JPEG_QUALITY, subsampling=-1):
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality, subsampling=subsampling)
+    return buf.getvalue()
+
+# --- 依檔案大小上限搜尋 JPEG 品質 ---
+# 先試預設品質，超過上限才以二分搜尋找出不超過 max_bytes 的最高品質；嘗試結果會快取避免重複編碼
+# try_444: 先嘗試不做色度抽樣 (4:4:4，文字較銳利)，放得下才採用
+# 回傳 (資料, 品質, 是否在上限內)
+def encode_jpeg_to_size(img, max_bytes, try_444=False):
+    attempts = {}
+
+    def attempt(quality, subsampling):
+        key = (quality, subsampling)
+        if key not in attempts:
+            attempts[key] = encode_jpeg(img, quality, subsampling)
+        return attempts[key]
+
+    if try_444:
+        data = attempt(JPEG_QUALITY, 0)
+        if len(data) <= max_bytes:
+            return data, JPEG_QUALITY, True
+
+    data = attempt(JPEG_QUALITY, -1)
+    if len(data) <= max_bytes:
+        return data, JPEG_QUALITY, True
+
+    lo, hi = JPEG_MIN_QUALITY, JPEG_QUALITY - 1
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if len(attempt(mid, -1)) <= max_bytes:
+            best = mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    if best is None:
+        return attempt(JPEG_MIN_QUALITY, -1), JPEG_MIN_QUALITY, False
+    return attempts[(best, -1)], best, True
+
+# --- 輸出排程：多執行緒同時組圖/編碼/寫檔 ---
+# tasks 為 [(存檔路徑, 產生圖片的函式)]；每個工作執行時才組圖，同時在記憶體中的切片數不超過 workers
+# 個別檔案失敗不會中斷其他檔案，回傳
+# {"saved": [...], "info": [(檔名, 品質, 位元組數, 是否在上限內)], "errors": [(檔名, 訊息)]}
+# max_bytes: 指定時改用檔案大小上限模式編碼 (try_444 見 encode_jpeg_to_size)
+# op: 效能記錄的操作名稱 (各階段為所有執行緒的耗時加總)
+def run_export_tasks(tasks, report=None, workers=ENCODE_WORKERS, max_bytes=None, try_444=False, op="export"):
+    def encode(save_path, make_image):
+        with PROFILER.span(op, "render"):
+            img = make_image()
+        with PROFILER.span(op, "encode"):
+            if max_bytes:
+                data, quality, fits = encode_jpeg_to_size(img, max_bytes, try_444)
+            else:
+                data, quality, fits = encode_jpeg(img), JPEG_QUALITY, True
+        with PROFILER.span(op, "write"):
+            with open(save_path, "wb") as f:
+                f.write(data)
+        return quality, len(data), fits
+
+    info = {}
+    saved = []
+    errors = []
+    total = len(tasks)
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(encode, path, make): path for path, make in tasks}
+        try:
+            for done, fut in enumerate(as_completed(futures)):
+                path = futures[fut]
+                try:
+                    info[path] = fut.result()
+                    saved.append(path)
+                except Exception as e:
+                    errors.append((path, str(e)))
+                if report: report(done, total, os.path.basename(path))
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            raise
+    order = {path: i for i, (path, _) in enumerate(tasks)}
+    saved.sort(key=order.get)
+    errors.sort(key=lambda e: order[e[0]])
+    return {"saved": saved,
+            "info": [(os.path.basename(path),) + info[path] for path in saved],
+            "errors": [(os.path.basename(path), msg) for path, msg in errors]}
+
+# --- 輸出：依 MAX_SLICE_HEIGHT 將選取區接續裁切成多張 ---
+# report(done, total, name) 用於回報進度，背景工作取消時會從 report 內拋出 JobCancelled
+# cuts: 智慧切線的位置 (與預覽分割線相同的計畫)，None 表示固定每 MAX_SLICE_HEIGHT 切一刀
+def export_sliced(stitched_image, intervals, output_dir, prefix, report=None, workers=ENCODE_WORKERS, max_bytes=None,
+                  try_444=False, cuts=None):
+    with PROFILER.operation("export_sliced"):
+        taken = set()
+        tasks = []
+        for idx, spans in enumerate(plan_slices(intervals, cuts=cuts), 1):
+            save_path = get_unique_filename(output_dir, f"{prefix}_{idx:02d}.jpg", taken)
+            tasks.append((save_path, lambda spans=spans: render_slice(stitched_image, spans)))
+        return run_export_tasks(tasks, report, workers, max_bytes, try_444, op="export_sliced")
+
+# --- 輸出：每個選取區各存一張 (不裁切) ---
+def export_raw(stitched_image, intervals, output_dir, prefix, report=None, workers=ENCODE_WORKERS, max_bytes=None,
+               try_444=False):
+    with PROFILER.operation("export_raw"):
+        taken = set()
+        tasks = []
+        for y1, y2 in intervals:
+            y1, y2 = int(y1), int(y2)
+            if y2 > y1:
+                save_path = get_unique_filename(output_dir, f"{prefix}_{len(tasks) + 1:02d}.jpg", taken)
+                tasks.append((save_path, lambda y1=y1, y2=y2: stitched_image.crop((0, y1, TARGET_WIDTH, y2))))
+        return run_export_tasks(tasks, report, workers, max_bytes, try_444, op="export_raw")
+
+# --- 批次處理 (無介面)：python shopee_tool.py batch 商品資料夾... -o 輸出資料夾 ---
+def list_product_images(folder):
+    names = [n for n in os.listdir(folder) if n.lower().endswith(IMAGE_EXTS)]
+    names.sort(key=lambda n: n.lower())
+    return [os.path.join(folder, n) for n in names]
+
+# 選取區檔案：JSON，可為 [[y1, y2], ...] 或 {"selections": [[y1, y2], ...]}
+def load_selections_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("selections", [])
+    return [(float(y1), float(y2)) for y1, y2 in data]
+
+# 單一商品：讀圖 -> 虛擬長圖 -> 依選取區輸出；可在子行程中執行
+def process_product(folder, output_dir, selections=None, mode="sliced", prefix=None, max_bytes=None,
+                    smart_cuts=False, decode_workers=1, encode_workers=1):
+    t0 = time.perf_counter()
+    summary = {"folder": folder, "output_dir": output_dir, "images": 0, "height": 0, "kept_height": 0,
+               "outputs": 0, "status": "ok", "errors": [], "seconds": {}}
+    try:
+        paths = list_product_images(folder)
+        summary["images"] = len(paths)
+        if not paths:
+            summary["status"] = "empty"
+            return summary
+
+        cache = NormalizedImageCache(CACHE_BUDGET_MB * 1024 * 1024)
+        decoded = decode_sources(cache, paths, decode_workers)
+        stitched = VirtualLongImage([key for key, _ in decoded], [img.height for _, img in decoded], cache)
+        t_decode = time.perf_counter()
+        summary["height"] = stitched.height
+
+        if selections is None:
+            selections = [(0, stitched.height)]
+        intervals = sorted((max(0, y1), min(stitched.height, y2)) for y1, y2 in selections)
+        intervals = [(y1, y2) for y1, y2 in intervals if y2 > y1]
+        kept_h = sum(int(y2) - int(y1) for y1, y2 in intervals)
+        summary["kept_height"] = kept_h
+
+        if mode == "sliced" and math.ceil(kept_h / MAX_SLICE_HEIGHT) > MAX_IMAGES:
+            # 與介面相同：超過張數上限時不輸出
+            summary["status"] = "over_limit"
+            summary["excess_height"] = kept_h - MAX_IMAGES * MAX_SLICE_HEIGHT
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+            if mode == "raw":
+                result = export_raw(stitched, intervals, output_dir, prefix or "Main", None, encode_workers, max_bytes)
+            else:
+                cuts = plan_cut_positions(intervals, cut_cost_index(stitched)) if smart_cuts else None
+                result = export_sliced(stitched, intervals, output_dir, prefix or "Shopee", None, encode_workers, max_bytes,
+                                       cuts=cuts)
+            summary["outputs"] = len(result["saved"])
+            summary["files"] = [{"name": name, "quality": q, "bytes": size, "fits": fits}
+                                for name, q, size, fits in result["info"]]
+            summary["errors"] = [f"{name}: {msg}" for name, msg in result["errors"]]
+            if result["errors"]:
+                summary["status"] = "partial"
+        summary["seconds"] = {"decode": round(t_decode - t0, 3),
+                              "export": round(time.perf_counter() - t_decode, 3)}
+    except Exception as e:
+        summary["status"] = "failed"
+        summary["errors"].append(str(e))
+    finally:
+        # 包含空資料夾提早返回的情況
+        summary["seconds_total"] = round(time.perf_counter() - t0, 3)
+    return summary
+
+# 多個商品以子行程平行處理，回傳 JSON 摘要 (dict)
+def run_batch(folders, output_root, selections_path=None, workers=None, mode="sliced", prefix=None,
+              max_bytes=None, smart_cuts=False):
+    t0 = time.perf_counter()
+    workers = workers or DECODE_WORKERS
+    global_sel = load_selections_file(selections_path) if selections_path else None
+    jobs = []
+    used_names = set()
+    for folder in folders:
+        folder = os.path.abspath(folder)
+        selections = global_sel
+        local_sel = os.path.join(folder, "selections.json")
+        if selections is None and os.path.exists(local_sel):
+            selections = load_selections_file(local_sel)
+        # 不同路徑下的同名資料夾 (A/001、B/001) 各自輸出到不同子資料夾，避免不同行程互相覆蓋檔案
+        base = os.path.basename(folder.rstrip(os.sep))
+        name, n = base, 1
+        while os.path.normcase(name) in used_names:
+            n += 1
+            name = f"{base}_{n}"
+        used_names.add(os.path.normcase(name))
+        output_dir = os.path.join(output_root, name)
+        jobs.append((folder, output_dir, selections, mode, prefix, max_bytes, smart_cuts))
+
+    if workers <= 1 or len(jobs) <= 1:
+        products = [process_product(*job, decode_workers=workers) for job in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            products = list(pool.map(process_product, *zip(*jobs)))
+
+    return {"workers": workers, "mode": mode, "products": products,
+            "outputs": sum(p["outputs"] for p in products),
+            "failed": sum(1 for p in products if p["status"] in ("failed", "partial", "over_limit")),
+            "seconds_total": round(time.perf_counter() - t0, 3)}
+
+def main_batch(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="shopee_tool.py batch", description="批次輸出蝦皮描述圖 (每個資料夾一個商品)")
+    parser.add_argument("folders", nargs="+", help="商品資料夾 (依檔名排序拼接)")
+    parser.add_argument("-o", "--output", required=True, help="輸出根目錄，每個商品各自建立子資料夾")
+    parser.add_argument("--selections", help="選取區 JSON 檔 (套用到所有商品)；未指定時使用資料夾內的 selections.json")
+    parser.add_argument("--mode", choices=("sliced", "raw"), default="sliced", help="sliced=裁切成 1600px, raw=每個選取區一張")
+    parser.add_argument("--prefix", help="檔名前綴 (預設 Shopee / Main)")
+    parser.add_argument("--max-kb", type=int, help="單檔大小上限 (KB)")
+    parser.add_argument("--smart-cuts", action="store_true", help="智慧切線：在 1600px 附近找最不會切到文字/商品的位置 (需要 numpy)")
+    parser.add_argument("--workers", type=int, default=DECODE_WORKERS, help="平行處理的行程數")
+    parser.add_argument("--summary", help="JSON 摘要輸出路徑 (預設 輸出根目錄/batch_summary.json)")
+    args = parser.parse_args(argv)
+
+    max_bytes = args.max_kb * 1024 if args.max_kb else None
+    summary = run_batch(args.folders, args.output, args.selections, args.workers, args.mode, args.prefix, max_bytes,
+                        args.smart_cuts)
+    os.makedirs(args.output, exist_ok=True)
+    summary_path = args.summary or os.path.join(args.output, "batch_summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    for p in summary["products"]:
+        print(f"[{p['status']}] {p['folder']}: {p['images']} 張來源 -> {p['outputs']} 張輸出 ({p['seconds_total']}s)")
+    print(f"共 {summary['outputs']} 張，{summary['seconds_total']}s，摘要: {summary_path}")
+    return 1 if summary["failed"] else 0
+
+# --- 影像分析：逐段讀取長圖的列 ---
+# 依來源區段逐塊回傳 (起始 y, 灰階 PIL 圖)，不需實體化整張長圖
+def iter_row_blocks(stitched_image):
+    if isinstance(stitched_image, VirtualLongImage):
+        for i, off in enumerate(stitched_image.offsets):
+            yield off, stitched_image.source(i).convert("L")
+    else:
+        yield 0, stitched_image.convert("L")
+
+# --- 影像分析：以 NumPy 列統計找出單色空白帶與分隔條 ---
+# 每列計算標準差 (變異) 與水平方向的邊緣能量，兩者都很低的列視為單色列；
+# 連續單色列高度 >= min_height 時回傳為可移除的 (y1, y2)，上下各留 pad 像素
+def detect_blank_bands(stitched_image, min_height=SMART_MIN_GAP, pad=SMART_GAP_PAD, std_tol=3.0, edge_tol=2.0):
+    import numpy as np
+
+    uniform_parts = []
+    for _, block in iter_row_blocks(stitched_image):
+        a = np.asarray(block, dtype=np.float32)
+        row_std = a.std(axis=1)
+        edge = np.abs(np.diff(a, axis=1)).mean(axis=1)
+        uniform_parts.append((row_std <= std_tol) & (edge <= edge_tol))
+    if not uniform_parts:
+        return []
+    uniform = np.concatenate(uniform_parts)
+
+    # 找出連續 True 的起訖
+    padded = np.concatenate(([False], uniform, [False])).astype(np.int8)
+    changes = np.flatnonzero(np.diff(padded))
+    starts, ends = changes[0::2], changes[1::2]
+    height = len(uniform)
+    bands = []
+    for y1, y2 in zip(starts.tolist(), ends.tolist()):
+        if y2 - y1 < min_height: continue
+        # 長圖頂端/底端的空白不需留白
+        top = y1 + pad if y1 > 0 else 0
+        bottom = y2 - pad if y2 < height else height
+        if bottom > top:
+            bands.append((top, bottom))
+    return bands
+
+def has_numpy():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+# --- 智慧切線：逐列的切割成本 ---
+# 切在第 y 列之前的成本 = 上下兩列的差異 + 兩列各自的水平邊緣能量 (文字、商品輪廓都很高)
+# cost[0] 為 0：來源圖之間的接縫本來就是好的切點
+def row_cut_cost(img):
+    import numpy as np
+    a = np.asarray(img.convert("L"), dtype=np.float32)
+    cost = np.zeros(a.shape[0], dtype=np.float32)
+    if a.shape[0] > 1:
+        edge = np.abs(np.diff(a, axis=1)).mean(axis=1)
+        cost[1:] = np.abs(np.diff(a, axis=0)).mean(axis=1) + edge[1:] + edge[:-1]
+    return cost
+
+# 整張長圖的切割成本索引；costs 為各來源 key 的 row_cut_cost 快取 (只計算缺少的來源)
+def cut_cost_index(stitched_image, costs=None):
+    import numpy as np
+    if not isinstance(stitched_image, VirtualLongImage):
+        return row_cut_cost(stitched_image)
+    costs = {} if costs is None else costs
+    parts = []
+    for i, key in enumerate(stitched_image.keys):
+        if key not in costs:
+            costs[key] = row_cut_cost(stitched_image.source(i))
+        parts.append(costs[key])
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+# --- 智慧切線：決定切線位置 ---
+# 回傳切線在「保留高度」座標 (選取區依序接起來) 上的位置；張數與固定 1600px 切法相同，
+# 每一刀在 [上一刀 + max_h - window, 上一刀 + max_h] 內挑成本最低的列，並保證剩下的高度還放得進剩下的張數
+def plan_cut_positions(intervals, cost, max_h=MAX_SLICE_HEIGHT, window=CUT_SEARCH_WINDOW):
+    import numpy as np
+    parts = []
+    for y1, y2 in intervals:
+        y1, y2 = int(y1), min(int(y2), len(cost))
+        if y2 > y1:
+            part = cost[y1:y2].copy()
+            part[0] = 0  # 選取區之間的接縫
+            parts.append(part)
+    if not parts:
+        return []
+    kept = np.concatenate(parts)
+    total = len(kept)
+    count = math.ceil(total / max_h)
+    cuts = []
+    prev = 0
+    for k in range(1, count):
+        hi = prev + max_h
+        lo = max(total - (count - k) * max_h, hi - window, prev + 1)
+        # 成本相同時取最下面的一列，讓每張盡量接近 max_h
+        window_cost = kept[lo:hi + 1][::-1]
+        prev = hi - int(np.argmin(window_cost))
+        cuts.append(prev)
+    return cuts
+
+# 將保留高度座標的切線轉回長圖座標，回傳 [(所屬選取區索引, y)]
+def cuts_to_lines(intervals, cuts):
+    lines = []
+    i = 0
+    start = 0
+    for cut in cuts:
+        while i < len(intervals) and start + int(intervals[i][1]) - int(intervals[i][0]) <= cut:
+            start += int(intervals[i][1]) - int(intervals[i][0])
+            i += 1
+        if i < len(intervals):
+            lines.append((i, int(intervals[i][0]) + cut - start))
+    return lines
+
+# --- 自動刪減：刪掉細節最少的區塊直到符合張數上限 ---
+# importance 為逐列的細節分數 (cut_cost_index，空白列為 0)；選取區切成 block 高的小塊，
+# 依平均分數由低到高累加到 excess 為止，最後一塊只刪需要的高度。回傳長圖座標的 [(y1, y2)] (相鄰區塊合併)
+def plan_trims(intervals, importance, excess, block=TRIM_BLOCK):
+    import numpy as np
+    if excess <= 0: return []
+    starts, ends = [], []
+    for y1, y2 in intervals:
+        # 區塊完全落在選取區內，刪除的高度才會與計畫相同
+        y1, y2 = math.ceil(y1), min(math.floor(y2), len(importance))
+        if y2 > y1:
+            b = np.arange(y1, y2, block)
+            starts.append(b)
+            ends.append(np.minimum(b + block, y2))
+    if not starts: return []
+    starts, ends = np.concatenate(starts), np.concatenate(ends)
+    heights = ends - starts
+    csum = np.concatenate(([0], np.cumsum(importance, dtype=np.float64)))
+    score = (csum[ends] - csum[starts]) / heights
+    order = np.argsort(score, kind="stable")
+    taken = np.cumsum(heights[order])
+    count = min(int(np.searchsorted(taken, excess)) + 1, len(order))
+    chosen = sorted(order[:count].tolist())
+    last = int(order[count - 1])
+    over = max(0, int(taken[count - 1]) - excess)
+
+    trims = []
+    for i in chosen:
+        y1, y2 = int(starts[i]), int(ends[i])
+        if i == last:
+            y2 -= over
+        if y2 <= y1: continue
+        if trims and trims[-1][1] == y1:
+            trims[-1] = (trims[-1][0], y2)
+        else:
+            trims.append((y1, y2))
+    return trims
+
+# 從選取區扣除要移除的區段
+def subtract_intervals(intervals, removals):
+    result = []
+    removals = sorted(removals)
+    for y1, y2 in sorted(intervals):
+        i = bisect.bisect_left(removals, (y1,))
+        if i > 0 and removals[i - 1][1] > y1:
+            i -= 1
+        cursor = y1
+        while i < len(removals) and removals[i][0] < y2:
+            r1, r2 = removals[i]
+            if r1 > cursor:
+                result.append((cursor, r1))
+            cursor = max(cursor, r2)
+            i += 1
+        if cursor < y2:
+            result.append((cursor, y2))
+    return result
+
+# --- 選取區模型：依 top 排序的區間 + Fenwick 樹維護的保留高度前綴和 ---
+# 「y 落在哪個選取區」用二分搜尋，「第 k 條分割線落在哪」沿 Fenwick 樹往下找，都是 O(log n)；
+# 調整大小/移動但順序不變時只更新一個節點，新增/刪除/分割/合併才整棵重建 (O(n))
+class SelectionModel:
+    def __init__(self, intervals=()):
+        self.version = 0
+        self.reset(intervals)
+
+    def reset(self, intervals):
+        pairs = sorted((float(t), float(b)) for t, b in intervals)
+        self.tops = [t for t, _ in pairs]
+        self.bottoms = [b for _, b in pairs]
+        self.rebuild()
+        self.dirty = 0
+
+    def rebuild(self):
+        n = len(self.tops)
+        tree = [0.0] * (n + 1)
+        for j in range(1, n + 1):
+            tree[j] += self.bottoms[j - 1] - self.tops[j - 1]
+            parent = j + (j & -j)
+            if parent <= n:
+                tree[parent] += tree[j]
+        self.tree = tree
+        self.version += 1
+
+    # 記錄第一個幾何有變動的選取區；None 表示上次繪製後沒有變動
+    def mark_dirty(self, i=0):
+        self.dirty = i if self.dirty is None else min(self.dirty, i)
+
+    def take_dirty(self):
+        dirty, self.dirty = self.dirty, None
+        return dirty
+
+    def __len__(self):
+        return len(self.tops)
+
+    def intervals(self):
+        return list(zip(self.tops, self.bottoms))
+
+    def span(self, i):
+        return self.tops[i], self.bottoms[i]
+
+    def kept_before(self, i):
+        total = 0.0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def total(self):
+        return self.kept_before(len(self.tops))
+
+    # 保留高度座標 pos 落在第幾個選取區：回傳 (i, 之前的累計高度)，滿足 kept_before(i) < pos <= kept_before(i + 1)
+    def locate(self, pos):
+        n = len(self.tops)
+        i, acc = 0, 0.0
+        step = 1 << (n.bit_length() - 1) if n else 0
+        while step:
+            nxt = i + step
+            if nxt <= n and acc + self.tree[nxt] < pos:
+                i = nxt
+                acc += self.tree[nxt]
+            step >>= 1
+        return i, acc
+
+    # 第 start 個選取區起的固定分割線 (每 max_h 保留高度一條，剛好落在選取區尾端的不畫)：[(所屬選取區, y)]
+    def cut_lines(self, start=0, max_h=MAX_SLICE_HEIGHT):
+        total = self.total()
+        pos = (math.floor(self.kept_before(start) / max_h) + 1) * max_h
+        lines = []
+        while pos < total:
+            i, acc = self.locate(pos)
+            if pos - acc < self.bottoms[i] - self.tops[i]:
+                lines.append((i, self.tops[i] + pos - acc))
+            pos += max_h
+        return lines
+
+    def index_at(self, y):
+        i = bisect.bisect_right(self.tops, y) - 1
+        if i >= 0 and y <= self.bottoms[i]:
+            return i
+        return -1
+
+    # 滑鼠命中測試：距離上/下緣 margin 內或落在區間內的第一個選取區 -> (i, "top" | "bottom" | "inside")；
+    # 合併後區間不重疊，bottoms 也是遞增的
+    def hit_test(self, y, margin):
+        i = bisect.bisect_right(self.bottoms, y - margin)
+        if i < len(self.tops) and self.tops[i] < y + margin:
+            if abs(y - self.tops[i]) < margin:
+                return i, "top"
+            if abs(y - self.bottoms[i]) < margin:
+                return i, "bottom"
+            return i, "inside"
+        return -1, None
+
+    def insert(self, top, bottom):
+        i = bisect.bisect_right(self.tops, top)
+        self.tops.insert(i, top)
+        self.bottoms.insert(i, bottom)
+        self.rebuild()
+        self.mark_dirty(i)
+        return i
+
+    def remove(self, i):
+        del self.tops[i]
+        del self.bottoms[i]
+        self.rebuild()
+        self.mark_dirty(i)
+
+    # 調整大小或移動；順序不變時只更新一個節點，否則移到新位置。回傳新的索引
+    def set(self, i, top, bottom):
+        if top == self.tops[i] and bottom == self.bottoms[i]: return i
+        if ((i == 0 or self.tops[i - 1] <= top)
+                and (i == len(self.tops) - 1 or top <= self.tops[i + 1])):
+            delta = (bottom - top) - (self.bottoms[i] - self.tops[i])
+            self.tops[i] = top
+            self.bottoms[i] = bottom
+            if delta:
+                j = i + 1
+                while j < len(self.tree):
+                    self.tree[j] += delta
+                    j += j & -j
+            self.version += 1
+            self.mark_dirty(i)
+            return i
+        self.remove(i)
+        return self.insert(top, bottom)
+
+    def split(self, i, y):
+        bottom = self.bottoms[i]
+        self.bottoms[i] = y
+        self.tops.insert(i + 1, y)
+        self.bottoms.insert(i + 1, bottom)
+        self.rebuild()
+        self.mark_dirty(i)
+        return i + 1
+
+    # 刪除高度不超過 min_height 的選取區
+    def drop_smaller(self, min_height):
+        keep = [j for j in range(len(self.tops)) if self.bottoms[j] - self.tops[j] > min_height]
+        if len(keep) == len(self.tops): return
+        first = next((k for k, j in enumerate(keep) if k != j), len(keep))
+        self.tops = [self.tops[j] for j in keep]
+        self.bottoms = [self.bottoms[j] for j in keep]
+        self.rebuild()
+        self.mark_dirty(first)
+
+    # 合併互相重疊的選取區 (相接的不合併)
+    def merge(self):
+        if not self.tops: return
+        pairs = sorted(zip(self.tops, self.bottoms))
+        merged = [list(pairs[0])]
+        for top, bottom in pairs[1:]:
+            if top < merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], bottom)
+            else:
+                merged.append([top, bottom])
+        tops = [t for t, _ in merged]
+        bottoms = [b for _, b in merged]
+        if tops == self.tops and bottoms == self.bottoms: return
+        first = 0
+        while first < len(tops) and tops[first] == self.tops[first] and bottoms[first] == self.bottoms[first]:
+            first += 1
+        self.tops, self.bottoms = tops, bottoms
+        self.rebuild()
+        self.mark_dirty(first)
+
+# --- 專案檔 ---
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# table: StitchEngine.table() 的 [(key, offset, height)]；selections: [(y1, y2)]
+# sha1s: 來源 key -> sha1 的快取，key 未變動的來源沿用舊值，只有新增或變動的來源才重新計算並寫回
+def save_project(path, table, selections, extra=None, sha1s=None):
+    sha1s = {} if sha1s is None else sha1s
+    base_dir = os.path.dirname(os.path.abspath(path))
+    sources = []
+    for key, offset, height in table:
+        src_path, mtime_ns, size = key
+        if key not in sha1s:
+            sha1s[key] = file_sha1(src_path)
+        sources.append({"path": src_path, "rel": os.path.relpath(src_path, base_dir),
+                        "mtime_ns": mtime_ns, "size": size, "sha1": sha1s[key],
+                        "offset": offset, "height": height})
+    data = {"version": PROJECT_VERSION, "width": TARGET_WIDTH, "sources": sources,
+            "selections": [[y1, y2] for y1, y2 in selections]}
+    data.update(extra or {})
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+# 讀取專案並重新驗證來源：mtime/大小相同直接沿用；不同時再比對 sha1，內容相同仍視為未變動
+# 每個來源回傳 {"path", "saved_key", "key", "height", "valid", "sha1"}，找不到的檔案 key 為 None
+def load_project(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version", 0) > PROJECT_VERSION:
+        raise ValueError("專案檔版本較新，請更新程式")
+    base_dir = os.path.dirname(os.path.abspath(path))
+    sources = []
+    for src in data.get("sources", []):
+        src_path = src["path"]
+        if not os.path.exists(src_path):
+            rel_path = os.path.normpath(os.path.join(base_dir, src.get("rel", "")))
+            if src.get("rel") and os.path.exists(rel_path):
+                src_path = rel_path
+        saved_key = (os.path.abspath(src["path"]), src["mtime_ns"], src["size"])
+        key = NormalizedImageCache.make_key(src_path) if os.path.exists(src_path) else None
+        valid = False
+        if key is not None:
+            valid = key[1:] == saved_key[1:] or (key[2] == src["size"] and file_sha1(src_path) == src.get("sha1"))
+        sources.append({"path": src_path, "saved_key": saved_key, "key": key,
+                        "height": src["height"], "valid": valid, "sha1": src.get("sha1")})
+    data["sources"] = sources
+    data["selections"] = [(float(y1), float(y2)) for y1, y2 in data.get("selections", [])]
+    return data
+
+# --- 背景工作 (QThreadPool) ---
+class JobCancelled(Exception):
+    pass
+
+class JobSignals(QObject):
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+class BackgroundJob(QRunnable):
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.signals = JobSignals()
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def report(self, done, total, name=""):
+        if self.is_cancelled:
+            raise JobCancelled()
+        self.signals.progress.emit(done, total, name)
+
+    def run(self):
+        try:
+            if self.is_cancelled:
+                raise JobCancelled()
+            result = self.fn(self, *self.args)
+        except JobCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+# --- 虛擬長圖 ---
+# 不實際配置整張拼接後的點陣圖，而是以區段表把 y 範圍對應到 (來源圖, 來源內偏移)
+# crop() 只讀取需要的列；來源圖透過快取取得，被淘汰時會重新解碼
+class VirtualLongImage:
+    mode = "RGB"
+
+    def __init__(self, keys, heights, cache):
+        self.keys = list(keys)
+        self.heights = list(heights)
+        self.cache = cache
+        self.offsets = []
+        y = 0
+        for h in self.heights:
+            self.offsets.append(y)
+            y += h
+        self.width = TARGET_WIDTH
+        self.height = y
+        self.size = (self.width, self.height)
+
+    def source(self, index):
+        key = self.keys[index]
+        return self.cache.load(key[0], key)
+
+    def with_cache(self, cache):
+        # 相同區段表，改由另一個快取 (例如輸出品質) 提供來源圖
+        return VirtualLongImage(self.keys, self.heights, cache)
+
+    def segments_in(self, y1, y2):
+        # 依序產生與 [y1, y2) 相交的 (index, 區段起點, 相交起點, 相交終點)
+        i = max(0, bisect.bisect_right(self.offsets, y1) - 1)
+        while i < len(self.offsets) and self.offsets[i] < y2:
+            off = self.offsets[i]
+            a, b = max(y1, off), min(y2, off + self.heights[i])
+            if b > a:
+                yield i, off, a, b
+            i += 1
+
+    def crop(self, box):
+        x1, y1, x2, y2 = (int(v) for v in box)
+        out = Image.new("RGB", (x2 - x1, y2 - y1), (255, 255, 255))
+        for i, off, a, b in self.segments_in(y1, y2):
+            out.paste(self.source(i).crop((x1, a - off, x2, b - off)), (0, a - y1))
+        return out
+
+    def resize(self, size, resample=None):
+        # 逐段縮放後堆疊，只配置縮圖大小的記憶體
+        if resample is None:
+            resample = Image.Resampling.BILINEAR
+        w, h = size
+        out = Image.new("RGB", (w, h), (255, 255, 255))
+        if self.height <= 0: return out
+        scale = h / self.height
+        for i, off in enumerate(self.offsets):
+            top = round(off * scale)
+            bottom = round((off + self.heights[i]) * scale)
+            if bottom > top:
+                out.paste(self.source(i).resize((w, bottom - top), resample), (0, top))
+        return out
+
+# --- 拼接引擎 ---
+# 維護每張來源圖的 y 偏移表並產生 VirtualLongImage；update() 可在背景執行緒呼叫
+class StitchEngine:
+    def __init__(self, cache):
+        self.cache = cache
+        self.image = None
+        self.keys = []
+        self.offsets = []
+        self.heights = []
+        self.shown_table = []  # 畫布目前顯示的 (key, offset, height)
+
+    def reset(self):
+        self.image = None
+        self.keys = []
+        self.offsets = []
+        self.heights = []
+        self.shown_table = []
+
+    def table(self):
+        return list(zip(self.keys, self.offsets, self.heights))
+
+    def is_dirty(self):
+        return self.table() != self.shown_table
+
+    def mark_shown(self):
+        self.shown_table = self.table()
+
+    # 畫布上的長圖與目前偏移表第一個不同之處的 y；在這之前的內容都沒變，None 表示完全相同
+    def first_change(self):
+        table = self.table()
+        end = 0
+        for old, new in zip(self.shown_table, table):
+            if old != new:
+                return old[1]
+            end = old[1] + old[2]
+        if len(self.shown_table) == len(table):
+            return None
+        return end
+
+    def update(self, keys, heights):
+        heights = list(heights)
+        if self.image is not None and keys == self.keys and heights == self.heights:
+            return
+        self.image = VirtualLongImage(keys, heights, self.cache)
+        self.keys = self.image.keys
+        self.offsets = self.image.offsets
+        self.heights = self.image.heights
+
+    def remap_intervals(self, intervals):
+        # 將畫布上 (shown_table) 的選取區間依偏移表搬到新位置；已移除的來源捨棄，新加入的來源預設全選。
+        # 同一路徑的檔案內容被改動 (key 不同) 時沿用原本的選取區：維持相對位置，
+        # 延伸到原圖底部的選取區改為延伸到新圖底部，超出新高度的部分捨去
+        if not self.shown_table:
+            return None
+        old_offsets = [off for _, off, _ in self.shown_table]
+        new_pos = {key: (off, h) for key, off, h in zip(self.keys, self.offsets, self.heights)}
+        new_by_path = {key[0]: key for key in self.keys}
+        mapped = []  # (y1, y2, 來自第幾個選取區)
+        for n, (y1, y2) in enumerate(intervals):
+            i = max(0, bisect.bisect_right(old_offsets, y1) - 1)
+            while i < len(self.shown_table):
+                key, off, h = self.shown_table[i]
+                if off >= y2:
+                    break
+                a, b = max(y1, off), min(y2, off + h)
+                if b > a:
+                    if key in new_pos:
+                        delta = new_pos[key][0] - off
+                        mapped.append((a + delta, b + delta, n))
+                    elif key[0] in new_by_path:
+                        new_off, new_h = new_pos[new_by_path[key[0]]]
+                        rel_b = new_h if b == off + h else min(b - off, new_h)
+                        if rel_b > a - off:
+                            mapped.append((new_off + a - off, new_off + rel_b, n))
+                i += 1
+
+        old_paths = {key[0] for key, _, _ in self.shown_table}
+        for key, off, h in zip(self.keys, self.offsets, self.heights):
+            if key[0] not in old_paths:
+                # 連續加入的新來源視為同一個選取區
+                mapped.append((off, off + h, len(intervals)))
+
+        # 同一個選取區被來源切開的片段相接時接回去；不同選取區只有真的重疊才合併，
+        # 原本分開 (相接) 的選取區維持分開，與 SelectionModel.merge 一致
+        mapped.sort()
+        merged = []
+        for a, b, n in mapped:
+            if merged and (a < merged[-1][1] or (a == merged[-1][1] and n == merged[-1][2])):
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b, n])
+        return [(a, b) for a, b, _ in merged]
+
 class DraggableListWidget(QListWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -71,7 +1351,9 @@ class DraggableListWidget(QListWidget):
             files = []
             for url in event.mimeData().urls():
                 path = url.toLocalFile()
-                if path.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.bmp')):
+                if os.path.isdir(path):
+                    files.extend(list_product_images(path))
+                elif path.lower().endswith(IMAGE_EXTS):
                     files.append(path)
             if self.mainWindow:
                 self.mainWindow.add_images_to_list(files)
@@ -92,32 +1374,109 @@ class MultiColMiniMap(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.image = None 
+        self.source = None  # 產生目前縮圖的長圖，相同時不重建縮圖
+        self.thumbs = {}  # 來源 key -> 單張來源縮圖 (由背景讀圖時產生，見 make_source_thumb)
+        self.incomplete = False  # 有來源縮圖尚未產生，讀圖完成後需重建
         self.selections = [] 
         self.column_gap = 10
         self.col_w = THUMB_WIDTH
+        self.layout_key = None
+        self.columns = []
+        self.highlights = []
         self.setMinimumWidth(self.col_w + 20)
 
     def update_data(self, pil_image, selection_rects):
-        if pil_image:
-            w, h = pil_image.size
-            if w > 0:
-                scale = self.col_w / w
-                new_h = int(h * scale)
-                thumb = pil_image.resize((self.col_w, new_h), Image.Resampling.BILINEAR)
-                if thumb.mode != "RGBA":
-                    thumb = thumb.convert("RGBA")
-                data = thumb.tobytes("raw", "RGBA")
-                qimg = QImage(data, self.col_w, new_h, QImage.Format.Format_RGBA8888)
-                self.image = QPixmap.fromImage(qimg)
-            else:
-                self.image = None
-        else:
-            self.image = None
-            
-        self.selections = selection_rects
-        self.update() 
+        with PROFILER.operation("minimap"):
+            if pil_image is not self.source:
+                with PROFILER.span("minimap", "thumbnail"):
+                    self.set_image(pil_image)
+            with PROFILER.span("minimap", "selections"):
+                self.set_selections(selection_rects)
+
+    def set_image(self, pil_image):
+        self.source = pil_image
+        self.image = None
+        self.incomplete = False
+        if pil_image and pil_image.width > 0:
+            self.image = pil_to_pixmap(self.build_thumbnail(pil_image))
+        self.layout_key = None
+        self.update()
         self.adjust_size_request()
 
+    def build_thumbnail(self, pil_image):
+        w, h = pil_image.size
+        scale = self.col_w / w
+        new_h = max(1, int(h * scale))
+        if not isinstance(pil_image, VirtualLongImage):
+            return pil_image.resize((self.col_w, new_h), Image.Resampling.BILINEAR)
+
+        # 由各來源縮圖拼成，不在介面執行緒解碼來源圖
+        thumb = Image.new("RGB", (self.col_w, new_h), (255, 255, 255))
+        for i, key in enumerate(pil_image.keys):
+            off = pil_image.offsets[i]
+            top = round(off * scale)
+            bottom = min(new_h, round((off + pil_image.heights[i]) * scale))
+            if bottom <= top: continue
+            src_thumb = self.thumbs.get(key)
+            if src_thumb is None:
+                self.incomplete = True
+                continue
+            if src_thumb.height != bottom - top:
+                src_thumb = src_thumb.resize((self.col_w, bottom - top), Image.Resampling.BILINEAR)
+            thumb.paste(src_thumb, (0, top))
+        return thumb
+
+    def set_selections(self, selection_rects):
+        # 只重繪選取區高亮有變動的部分
+        old_highlights = self.highlights
+        self.selections = selection_rects
+        self.highlights = []
+        if self.layout_key is None or not self.image:
+            self.update()
+            return
+        self.update_layout()
+        changed = set(old_highlights).symmetric_difference(self.highlights)
+        for x, y, w, h in changed:
+            self.update(x, y, w, h)
+
+    def view_height(self):
+        view_h = self.parent().height() if self.parent() else self.height()
+        if view_h <= 0: view_h = 100
+        return view_h
+
+    def update_layout(self):
+        # 欄位配置只在圖片或可視高度改變時重算；高亮依所在欄位直接分配，不再逐欄檢查所有選取區
+        view_h = self.view_height()
+        img_h = self.image.height()
+        key = (view_h, img_h)
+        if key != self.layout_key:
+            self.layout_key = key
+            self.columns = []
+            cols_needed = math.ceil(img_h / view_h)
+            for col in range(cols_needed):
+                src_y_start = col * view_h
+                src_y_end = min((col + 1) * view_h, img_h)
+                if src_y_end <= src_y_start: break
+                dst_x = 10 + col * (self.col_w + self.column_gap)
+                self.columns.append((dst_x, src_y_start, src_y_end))
+
+        scale_ratio = self.col_w / TARGET_WIDTH
+        highlights = []
+        for (orig_y1, orig_y2) in self.selections:
+            thumb_y1 = orig_y1 * scale_ratio
+            thumb_y2 = orig_y2 * scale_ratio
+            first = max(0, int(thumb_y1 // view_h))
+            last = min(len(self.columns) - 1, int(thumb_y2 // view_h))
+            for col in range(first, last + 1):
+                dst_x, src_y_start, src_y_end = self.columns[col]
+                intersect_y1 = max(thumb_y1, src_y_start)
+                intersect_y2 = min(thumb_y2, src_y_end)
+                if intersect_y2 > intersect_y1:
+                    rect_y = intersect_y1 - src_y_start
+                    rect_h = intersect_y2 - intersect_y1
+                    highlights.append((int(dst_x), int(rect_y), int(self.col_w), int(rect_h)))
+        self.highlights = highlights
+
     def get_ideal_width(self):
         if not self.image: return 150
         view_h = self.parent().height() if self.parent() else 800
@@ -133,39 +1492,23 @@ class MultiColMiniMap(QWidget):
         self.resize(req_w, self.height())
 
     def paintEvent(self, event):
+        with PROFILER.operation("minimap_paint"), PROFILER.span("minimap_paint", "paint"):
+            self.paint_columns()
+
+    def paint_columns(self):
         painter = QPainter(self)
         if not self.image: return 
 
-        view_h = self.parent().height() if self.parent() else self.height()
-        if view_h <= 0: view_h = 100
-        img_h = self.image.height()
-        cols_needed = math.ceil(img_h / view_h)
-        scale_ratio = self.col_w / TARGET_WIDTH
+        if self.layout_key != (self.view_height(), self.image.height()):
+            self.update_layout()
+
+        for dst_x, src_y_start, src_y_end in self.columns:
+            painter.drawPixmap(dst_x, 0, self.image, 0, src_y_start, self.col_w, src_y_end - src_y_start)
 
         painter.setBrush(QBrush(QColor(233, 30, 99, 100))) 
         painter.setPen(Qt.PenStyle.NoPen)
-
-        for col in range(cols_needed):
-            src_y_start = col * view_h
-            src_y_end = min((col + 1) * view_h, img_h)
-            slice_h = src_y_end - src_y_start
-            if slice_h <= 0: break
-            
-            dst_x = 10 + col * (self.col_w + self.column_gap)
-            dst_y = 0 
-            
-            painter.drawPixmap(dst_x, dst_y, self.image, 0, src_y_start, self.col_w, slice_h)
-
-            if self.selections:
-                for (orig_y1, orig_y2) in self.selections:
-                    thumb_y1 = orig_y1 * scale_ratio
-                    thumb_y2 = orig_y2 * scale_ratio
-                    intersect_y1 = max(thumb_y1, src_y_start)
-                    intersect_y2 = min(thumb_y2, src_y_end)
-                    if intersect_y2 > intersect_y1:
-                        rect_y = intersect_y1 - src_y_start
-                        rect_h = intersect_y2 - intersect_y1
-                        painter.drawRect(int(dst_x), int(rect_y), int(self.col_w), int(rect_h))
+        for x, y, w, h in self.highlights:
+            painter.drawRect(x, y, w, h)
 
 class CropCanvas(QGraphicsView):
     def __init__(self, parent=None):
@@ -173,18 +1516,37 @@ class CropCanvas(QGraphicsView):
         self.scene = QGraphicsScene(self)
         self.setScene(self.scene)
         self.setBackgroundBrush(QBrush(QColor("#222")))
-        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.FullViewportUpdate)
+        # 只重繪有變動的區域；固定在視窗上的背景圖於捲動時另外補畫 (見 scrollContentsBy)
+        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.SmartViewportUpdate)
         
+        # 看板娘背景在視窗第一次繪製後才載入 (load_decorations)
         self.bg_char_pixmap = None
-        char_path = resource_path("Azrael_Full.png")
-        if os.path.exists(char_path):
-            self.bg_char_pixmap = QPixmap(char_path)
+        # 背景色 + 縮放後的背景圖合成一張視窗大小的 pixmap，視窗大小或背景色改變時才重畫
+        self.bg_cache = None
+        self.bg_cache_key = None
+        self.bg_char_rect = QRect()
         
-        self.pixmap_item = None
-        self.dark_overlay = None 
+        # 長圖以固定高度分塊，只在進入可視範圍時才轉換/上傳，畫面外的分塊會被回收
+        self.source_image = None
+        self.tile_items = {}  # (level, index) -> 目前在場景中的分塊
+        self.tile_cache = OrderedDict()  # (level, index) -> QPixmap (LRU)
+        self.mask_items = None  # 選取區之間空隙的暗色遮罩 (每個空隙一個矩形，拖曳時只更新變動的空隙)
+        self.mask_owner = []  # 每個空隙之後的選取區索引
         self.selection_items = []
         self.split_lines = []
-        self.selections = [] 
+        # 選取區 (排序的區間 + 保留高度前綴和)；selections 屬性提供 QRectF 清單給外部讀取/整批指定
+        self.model = SelectionModel()
+        self.selection_rects = None  # (model.version, [QRectF])
+        # 每條分割線所屬的選取區
+        self.line_owner = []
+        self.overlay_style = None
+        # 智慧切線的逐列成本 (cut_cost_index)；None 表示固定每 MAX_SLICE_HEIGHT 切一刀
+        self.cut_cost = None
+        self.trim_overlay = None  # 自動刪減的建議區段 (紅色)
+        self.overlay_timer = QTimer(self)
+        self.overlay_timer.setSingleShot(True)
+        self.overlay_timer.setInterval(16)
+        self.overlay_timer.timeout.connect(self.refresh_overlays)
         
         self.current_action = None 
         self.active_rect_index = -1
@@ -196,115 +1558,357 @@ class CropCanvas(QGraphicsView):
         self.border_color = QColor("#F06292") 
         self.split_line_color = QColor("#FFEB3B")
 
+    def load_decorations(self):
+        char_path = resource_path("Azrael_Full.png")
+        if os.path.exists(char_path):
+            self.bg_char_pixmap = QPixmap(char_path)
+            self.bg_cache_key = None
+            self.viewport().update()
+
+    def render_background(self):
+        view_w = self.viewport().width()
+        view_h = self.viewport().height()
+        dpr = self.viewport().devicePixelRatioF()
+        cache = QPixmap(max(1, round(view_w * dpr)), max(1, round(view_h * dpr)))
+        cache.setDevicePixelRatio(dpr)
+        painter = QPainter(cache)
+        painter.fillRect(QRectF(0, 0, view_w, view_h), self.backgroundBrush())
+        target_h = int(view_h * 0.7) 
+        scaled_pix = self.bg_char_pixmap.scaledToHeight(target_h, Qt.TransformationMode.SmoothTransformation)
+        if scaled_pix.width() > view_w * 0.6:
+            scaled_pix = self.bg_char_pixmap.scaledToWidth(int(view_w * 0.6), Qt.TransformationMode.SmoothTransformation)
+        x = view_w - scaled_pix.width() - 20
+        y = view_h - scaled_pix.height() - 20
+        painter.setOpacity(0.5)
+        painter.drawPixmap(x, y, scaled_pix)
+        painter.end()
+        self.bg_char_rect = QRect(x, y, scaled_pix.width(), scaled_pix.height())
+        return cache
+
     def drawBackground(self, painter, rect):
-        super().drawBackground(painter, rect)
-        if self.bg_char_pixmap and not self.bg_char_pixmap.isNull():
-            painter.save()
-            painter.resetTransform()
-            view_w = self.viewport().width()
-            view_h = self.viewport().height()
-            target_h = int(view_h * 0.7) 
-            scaled_pix = self.bg_char_pixmap.scaledToHeight(target_h, Qt.TransformationMode.SmoothTransformation)
-            if scaled_pix.width() > view_w * 0.6:
-                scaled_pix = self.bg_char_pixmap.scaledToWidth(int(view_w * 0.6), Qt.TransformationMode.SmoothTransformation)
-            x = view_w - scaled_pix.width() - 20
-            y = view_h - scaled_pix.height() - 20
-            painter.setOpacity(0.5)
-            painter.drawPixmap(x, y, scaled_pix)
-            painter.restore()
-
-    def load_image(self, pil_image):
+        if self.bg_char_pixmap is None or self.bg_char_pixmap.isNull():
+            super().drawBackground(painter, rect)
+            return
+        key = (self.viewport().width(), self.viewport().height(), self.viewport().devicePixelRatioF(),
+               self.backgroundBrush().color().rgba())
+        if key != self.bg_cache_key:
+            self.bg_cache = self.render_background()
+            self.bg_cache_key = key
+        # 只貼上這次需要重繪的部分
+        dpr = self.bg_cache.devicePixelRatio()
+        target = QRectF(self.mapFromScene(rect).boundingRect().adjusted(-1, -1, 1, 1))
+        target = target.intersected(QRectF(self.viewport().rect()))
+        source = QRectF(target.x() * dpr, target.y() * dpr, target.width() * dpr, target.height() * dpr)
+        painter.save()
+        painter.resetTransform()
+        painter.drawPixmap(target, self.bg_cache, source)
+        painter.restore()
+
+    def clear_image(self):
+        # 先清掉狀態：setSceneRect 可能觸發 scrollContentsBy -> update_tiles
+        self.source_image = None
+        self.tile_items = {}
         self.scene.clear()
-        self.pixmap_item = None
-        self.dark_overlay = None
+        self.scene.setSceneRect(QRectF())
+        self.tile_cache.clear()
+        self.mask_items = None
+        self.trim_overlay = None
         self.selection_items = []
         self.split_lines = []
-        self.selections = []
-        
+        self.model.reset([])
+        self.line_owner = []
+        self.active_rect_index = -1
+        self.current_action = None
+
+    def load_image(self, pil_image, selections=None):
+        with PROFILER.operation("load_image"):
+            with PROFILER.span("load_image", "clear"):
+                self.clear_image()
+            self.set_source(pil_image, selections)
+
+    # 換成新的長圖，但保留 changed_y 以上的分塊與目前的捲動位置 (例如只有一張來源被改動時)
+    def replace_image(self, pil_image, selections, changed_y):
+        if self.source_image is None or pil_image.size[0] != self.image_width:
+            self.load_image(pil_image, selections)
+            return
+        with PROFILER.operation("load_image"):
+            with PROFILER.span("load_image", "clear"):
+                def stale(key):
+                    return (key[1] + 1) * (TILE_HEIGHT << key[0]) > changed_y
+                for key in [k for k in self.tile_items if stale(k)]:
+                    self.scene.removeItem(self.tile_items.pop(key))
+                for key in [k for k in self.tile_cache if stale(k)]:
+                    del self.tile_cache[key]
+                self.active_rect_index = -1
+                self.current_action = None
+            self.set_source(pil_image, selections)
+
+    def set_source(self, pil_image, selections):
+        self.source_image = pil_image
         self.image_width, self.image_height = pil_image.size
-        if pil_image.mode != "RGBA":
-            pil_image = pil_image.convert("RGBA")
-        data = pil_image.tobytes("raw", "RGBA")
-        qimage = QImage(data, self.image_width, self.image_height, QImage.Format.Format_RGBA8888)
-        pixmap = QPixmap.fromImage(qimage)
-        
-        self.pixmap_item = QGraphicsPixmapItem(pixmap)
-        self.pixmap_item.setZValue(0) 
-        self.scene.addItem(self.pixmap_item)
-        self.reset_to_full_selection() 
+        self.scene.setSceneRect(QRectF(0, 0, self.image_width, self.image_height))
+        with PROFILER.span("load_image", "tiles"):
+            self.update_tiles()
+        with PROFILER.span("load_image", "overlays"):
+            if selections is None:
+                self.reset_to_full_selection()
+            else:
+                self.model.reset(selections)
+                self.refresh_overlays()
+
+    def mip_level(self):
+        # 縮小顯示時改用低解析度分塊：每縮小一半升一級
+        scale = self.transform().m22()
+        level = 0
+        while scale < 0.5 and level < 3:
+            scale *= 2
+            level += 1
+        return level
+
+    def render_tile(self, level, index):
+        factor = 1 << level
+        span = TILE_HEIGHT * factor
+        y1 = index * span
+        y2 = min(y1 + span, self.image_height)
+        with PROFILER.span("tiles", "crop"):
+            tile = self.source_image.crop((0, y1, self.image_width, y2))
+            if factor > 1:
+                tile = tile.reduce(factor)
+        with PROFILER.span("tiles", "to_qimage"):
+            return pil_to_pixmap(tile)
+
+    def update_tiles(self):
+        with PROFILER.operation("tiles"):
+            self.place_tiles()
+
+    def place_tiles(self):
+        if self.source_image is None: return
+        level = self.mip_level()
+        factor = 1 << level
+        span = TILE_HEIGHT * factor
+        visible = self.mapToScene(self.viewport().rect()).boundingRect()
+        first = max(0, int(visible.top() // span) - 1)
+        last = min((self.image_height - 1) // span, int(visible.bottom() // span) + 1)
+        wanted = {(level, i) for i in range(first, last + 1)}
+
+        for key in list(self.tile_items):
+            if key not in wanted:
+                self.scene.removeItem(self.tile_items.pop(key))
+
+        for key in sorted(wanted):
+            if key in self.tile_items: continue
+            pixmap = self.tile_cache.get(key)
+            if pixmap is None:
+                pixmap = self.render_tile(*key)
+                self.tile_cache[key] = pixmap
+            self.tile_cache.move_to_end(key)
+            item = QGraphicsPixmapItem(pixmap)
+            item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+            item.setPos(0, key[1] * span)
+            item.setScale(factor)
+            item.setZValue(0)
+            self.scene.addItem(item)
+            self.tile_items[key] = item
+
+        while len(self.tile_cache) > TILE_CACHE_LIMIT + len(wanted):
+            key = next(k for k in self.tile_cache if k not in wanted)
+            del self.tile_cache[key]
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        # 捲動時內容以區塊搬移，固定在視窗上的背景圖也被一起搬走：
+        # 原位置與搬移後的殘影都要補畫 (其餘背景是單色，搬移後仍正確)
+        if self.bg_cache is not None:
+            self.viewport().update(self.bg_char_rect.united(self.bg_char_rect.translated(dx, dy)))
+        self.update_tiles()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_tiles()
+
+    def wheelEvent(self, event):
+        # Ctrl + 滾輪縮放
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            factor = 1.25 ** (event.angleDelta().y() / 120)
+            scale = self.transform().m22() * factor
+            if 0.05 <= scale <= 4:
+                self.scale(factor, factor)
+                self.update_tiles()
+            return
+        super().wheelEvent(event)
 
     def reset_to_full_selection(self):
-        if not self.pixmap_item: return
-        self.selections = [QRectF(0, 0, self.image_width, self.image_height)]
+        if self.source_image is None: return
+        self.model.reset([(0, self.image_height)])
         self.refresh_overlays()
 
-    def refresh_overlays(self):
-        if not self.pixmap_item: return
-
-        if self.dark_overlay: 
-            self.scene.removeItem(self.dark_overlay)
-            self.dark_overlay = None
-        for item in self.selection_items:
-            self.scene.removeItem(item)
-        self.selection_items = []
-        for line in self.split_lines:
-            self.scene.removeItem(line)
-        self.split_lines = []
+    # 唯讀的快照：直接改動回傳的 QRectF 不會影響選取區，修改請整批指定或透過 model
+    @property
+    def selections(self):
+        if self.selection_rects is None or self.selection_rects[0] != self.model.version:
+            rects = [QRectF(0, top, self.image_width, bottom - top) for top, bottom in self.model.intervals()]
+            self.selection_rects = (self.model.version, rects)
+        return list(self.selection_rects[1])
+
+    @selections.setter
+    def selections(self, rects):
+        self.model.reset((r.top(), r.bottom()) for r in rects)
+
+    def set_cut_cost(self, cost):
+        if cost is None and self.cut_cost is None: return
+        self.cut_cost = cost
+        self.model.mark_dirty(0)  # 強制重算分割線
+        self.refresh_overlays()
 
-        full_rect = QRectF(0, 0, self.image_width, self.image_height)
-        mask_path = QPainterPath()
-        mask_path.addRect(full_rect)
-        selection_path = QPainterPath()
-        for sel in self.selections:
-            selection_path.addRect(sel)
-        final_mask = mask_path.subtracted(selection_path)
-        
-        self.dark_overlay = QGraphicsPathItem(final_mask)
-        self.dark_overlay.setBrush(QBrush(QColor(0, 0, 0, 180)))
-        self.dark_overlay.setPen(QPen(Qt.PenStyle.NoPen))
-        self.dark_overlay.setZValue(1)
-        self.scene.addItem(self.dark_overlay)
-
-        border_pen = QPen(self.border_color)
-        border_pen.setWidth(3)
-        border_pen.setStyle(Qt.PenStyle.DashLine)
-        split_pen = QPen(self.split_line_color)
-        split_pen.setWidth(2)
-        split_pen.setStyle(Qt.PenStyle.DotLine)
-
-        total_pixels = 0
-        self.selections.sort(key=lambda r: r.top())
-        accumulated_h = 0
-        
-        for sel in self.selections:
-            rect_item = QGraphicsRectItem(sel)
-            rect_item.setPen(border_pen)
-            rect_item.setZValue(2)
-            self.scene.addItem(rect_item)
-            self.selection_items.append(rect_item)
-            
-            chunk_h = sel.height()
-            current_chunk_y = 0
-            while current_chunk_y < chunk_h:
-                space_left = MAX_SLICE_HEIGHT - (accumulated_h % MAX_SLICE_HEIGHT)
-                if space_left < chunk_h - current_chunk_y:
-                    cut_y = current_chunk_y + space_left
-                    abs_y = sel.top() + cut_y
-                    line = QGraphicsLineItem(0, abs_y, self.image_width, abs_y)
-                    line.setPen(split_pen)
-                    line.setZValue(2)
-                    self.scene.addItem(line)
-                    self.split_lines.append(line)
-                    accumulated_h += space_left
-                    current_chunk_y += space_left
+    # 智慧切線的切線位置 (保留高度座標)；預覽分割線與輸出共用這一份計畫
+    def slice_cuts(self):
+        if self.cut_cost is None or self.source_image is None: return None
+        return plan_cut_positions(self.model.intervals(), self.cut_cost)
+
+    # 顯示建議刪除的區段 (不改動選取區)；trims 為空時移除標示
+    def show_trims(self, trims):
+        if self.trim_overlay is not None:
+            self.scene.removeItem(self.trim_overlay)
+            self.trim_overlay = None
+        if not trims: return
+        path = QPainterPath()
+        for y1, y2 in trims:
+            path.addRect(QRectF(0, y1, self.image_width, y2 - y1))
+        self.trim_overlay = QGraphicsPathItem(path)
+        self.trim_overlay.setBrush(QBrush(QColor(229, 57, 53, 140)))
+        self.trim_overlay.setPen(QPen(Qt.PenStyle.NoPen))
+        self.trim_overlay.setZValue(3)
+        self.scene.addItem(self.trim_overlay)
+
+    def schedule_overlays(self):
+        # 拖曳時每個畫面更新週期最多重算一次
+        if not self.overlay_timer.isActive():
+            self.overlay_timer.start()
+
+    def border_pen(self):
+        pen = QPen(self.border_color)
+        pen.setWidth(3)
+        pen.setStyle(Qt.PenStyle.DashLine)
+        return pen
+
+    def split_pen(self):
+        pen = QPen(self.split_line_color)
+        pen.setWidth(2)
+        pen.setStyle(Qt.PenStyle.DotLine)
+        return pen
+
+    # 保留既有的圖形物件，只更新有變動的幾何；分割線從第一個有變動的選取區開始重算
+    def refresh_overlays(self):
+        with PROFILER.operation("overlays"):
+            self.rebuild_overlays()
+
+    def rebuild_overlays(self):
+        self.overlay_timer.stop()
+        if self.source_image is None: return
+
+        style = (self.border_color.rgba(), self.split_line_color.rgba())
+        if style != self.overlay_style:
+            self.overlay_style = style
+            border_pen = self.border_pen()
+            split_pen = self.split_pen()
+            for item in self.selection_items:
+                item.setPen(border_pen)
+            for line in self.split_lines:
+                line.setPen(split_pen)
+
+        model = self.model
+        first = model.take_dirty()
+        if self.mask_items is None:
+            first = 0
+
+        if first is not None:
+            layout = model.intervals()
+            with PROFILER.span("overlays", "mask"):
+                # 暗色遮罩直接由選取區之間的空隙組成，不做路徑布林運算；
+                # 每個空隙一個矩形，第 first 個選取區之前的空隙不變，從那裡接著重算
+                if self.mask_items is None:
+                    self.mask_items = []
+                    self.mask_owner = []
+                keep = bisect.bisect_left(self.mask_owner, first)
+                cursor = max(model.bottoms[:first], default=0)
+                gaps = []
+                for i in range(first, len(layout)):
+                    top, bottom = layout[i]
+                    if top > cursor:
+                        gaps.append((i, cursor, top))
+                    cursor = max(cursor, bottom)
+                if cursor < self.image_height:
+                    gaps.append((len(layout), cursor, self.image_height))
+                mask_brush = QBrush(QColor(0, 0, 0, 180))
+                for j, (owner, y1, y2) in enumerate(gaps):
+                    gap = QRectF(0, y1, self.image_width, y2 - y1)
+                    if keep + j < len(self.mask_items):
+                        self.mask_items[keep + j].setRect(gap)
+                    else:
+                        item = QGraphicsRectItem(gap)
+                        item.setBrush(mask_brush)
+                        item.setPen(QPen(Qt.PenStyle.NoPen))
+                        item.setZValue(1)
+                        self.scene.addItem(item)
+                        self.mask_items.append(item)
+                for item in self.mask_items[keep + len(gaps):]:
+                    self.scene.removeItem(item)
+                del self.mask_items[keep + len(gaps):]
+                self.mask_owner = self.mask_owner[:keep] + [owner for owner, _, _ in gaps]
+
+                border_pen = self.border_pen()
+                for i in range(first, len(layout)):
+                    top, bottom = layout[i]
+                    rect = QRectF(0, top, self.image_width, bottom - top)
+                    if i < len(self.selection_items):
+                        self.selection_items[i].setRect(rect)
+                    else:
+                        rect_item = QGraphicsRectItem(rect)
+                        rect_item.setPen(border_pen)
+                        rect_item.setZValue(2)
+                        self.scene.addItem(rect_item)
+                        self.selection_items.append(rect_item)
+                for item in self.selection_items[len(layout):]:
+                    self.scene.removeItem(item)
+                del self.selection_items[len(layout):]
+
+            with PROFILER.span("overlays", "split_lines"):
+                # 第 first 個選取區之前的分割線不受影響；之後的由前綴和直接定位，不必逐段累加
+                keep = bisect.bisect_left(self.line_owner, first)
+                cuts = self.slice_cuts()
+                if cuts is not None:
+                    # 智慧切線的位置取決於整段選取區，全部重算 (最多 MAX_IMAGES 條)
+                    keep = 0
+                    new_lines = cuts_to_lines(layout, cuts)
                 else:
-                    accumulated_h += (chunk_h - current_chunk_y)
-                    current_chunk_y = chunk_h
-            total_pixels += chunk_h
-        self.window().update_stats(total_pixels, self.selections)
+                    new_lines = model.cut_lines(first)
+                split_pen = self.split_pen()
+                for j, (owner, abs_y) in enumerate(new_lines):
+                    if keep + j < len(self.split_lines):
+                        self.split_lines[keep + j].setLine(0, abs_y, self.image_width, abs_y)
+                    else:
+                        line = QGraphicsLineItem(0, abs_y, self.image_width, abs_y)
+                        line.setPen(split_pen)
+                        line.setZValue(2)
+                        self.scene.addItem(line)
+                        self.split_lines.append(line)
+                for line in self.split_lines[keep + len(new_lines):]:
+                    self.scene.removeItem(line)
+                del self.split_lines[keep + len(new_lines):]
+                self.line_owner = self.line_owner[:keep] + [owner for owner, _ in new_lines]
+
+        with PROFILER.span("overlays", "stats"):
+            self.window().update_stats(model.total(), model.intervals())
+
+    # 點在圖片寬度外的不算落在選取區內
+    def hit_test(self, pos, y, margin):
+        i, kind = self.model.hit_test(y, margin)
+        if kind == "inside" and not 0 <= pos.x() <= self.image_width:
+            return -1, None
+        return i, kind
 
     def mousePressEvent(self, event):
-        if not self.pixmap_item: return
+        if self.source_image is None: return
 
         pos = self.mapToScene(event.pos())
         y = pos.y()
@@ -316,40 +1920,37 @@ class CropCanvas(QGraphicsView):
         self.drag_start_pos_global = event.globalPosition() 
         
         if event.button() == Qt.MouseButton.RightButton:
-            for i, rect in enumerate(self.selections):
-                if rect.contains(pos):
-                    del self.selections[i]
-                    self.refresh_overlays()
-                    return
-        
-        for i, rect in enumerate(self.selections):
-            if abs(y - rect.top()) < margin:
-                self.current_action = 'RESIZE_TOP'
-                self.active_rect_index = i
-                return
-            elif abs(y - rect.bottom()) < margin:
-                self.current_action = 'RESIZE_BOTTOM'
-                self.active_rect_index = i
-                return
-            elif rect.contains(pos):
-                self.current_action = 'MOVE_OR_SPLIT'
-                self.active_rect_index = i
-                self.drag_start_y = y
-                self.drag_offset_top = rect.top()
-                self.drag_offset_bottom = rect.bottom()
+            i = self.model.index_at(pos.y())
+            if i != -1 and 0 <= pos.x() <= self.image_width:
+                self.model.remove(i)
+                self.refresh_overlays()
                 return
+        
+        i, kind = self.hit_test(pos, y, margin)
+        if kind == "top":
+            self.current_action = 'RESIZE_TOP'
+            self.active_rect_index = i
+            return
+        elif kind == "bottom":
+            self.current_action = 'RESIZE_BOTTOM'
+            self.active_rect_index = i
+            return
+        elif kind == "inside":
+            self.current_action = 'MOVE_OR_SPLIT'
+            self.active_rect_index = i
+            self.drag_start_y = y
+            self.drag_offset_top, self.drag_offset_bottom = self.model.span(i)
+            return
 
         if self.current_action is None:
             self.current_action = 'CREATE'
             self.drag_start_y = y
-            new_rect = QRectF(0, y, self.image_width, 0)
-            self.selections.append(new_rect)
-            self.active_rect_index = len(self.selections) - 1
+            self.active_rect_index = self.model.insert(y, y)
 
         super().mousePressEvent(event)
 
     def mouseMoveEvent(self, event):
-        if not self.pixmap_item: return
+        if self.source_image is None: return
 
         pos = self.mapToScene(event.pos())
         y = pos.y()
@@ -357,21 +1958,16 @@ class CropCanvas(QGraphicsView):
         
         margin = 20
 
-        cursor_set = False
-        for rect in self.selections:
-            if abs(y - rect.top()) < margin or abs(y - rect.bottom()) < margin:
-                self.setCursor(Qt.CursorShape.SizeVerCursor)
-                cursor_set = True
-                break
-            elif rect.contains(pos):
-                self.setCursor(Qt.CursorShape.SizeAllCursor) 
-                cursor_set = True
-                break
-        if not cursor_set:
+        kind = self.hit_test(pos, y, margin)[1]
+        if kind in ("top", "bottom"):
+            self.setCursor(Qt.CursorShape.SizeVerCursor)
+        elif kind == "inside":
+            self.setCursor(Qt.CursorShape.SizeAllCursor) 
+        else:
             self.setCursor(Qt.CursorShape.ArrowCursor)
 
         if self.current_action and self.active_rect_index != -1:
-            rect = self.selections[self.active_rect_index]
+            top, bottom = self.model.span(self.active_rect_index)
             
             if self.current_action == 'MOVE_OR_SPLIT':
                 dist = (event.globalPosition() - self.drag_start_pos_global).manhattanLength()
@@ -379,49 +1975,39 @@ class CropCanvas(QGraphicsView):
                     self.current_action = 'MOVE'
             
             if self.current_action == 'RESIZE_TOP':
-                new_top = min(y, rect.bottom() - 10)
-                new_top = max(0, new_top)
-                self.selections[self.active_rect_index].setTop(new_top)
+                top = max(0, min(y, bottom - 10))
             elif self.current_action == 'RESIZE_BOTTOM':
-                new_bottom = max(y, rect.top() + 10)
-                new_bottom = min(self.image_height, new_bottom)
-                self.selections[self.active_rect_index].setBottom(new_bottom)
+                bottom = min(self.image_height, max(y, top + 10))
             elif self.current_action == 'CREATE':
                 top = min(self.drag_start_y, y)
                 bottom = max(self.drag_start_y, y)
-                self.selections[self.active_rect_index].setTop(top)
-                self.selections[self.active_rect_index].setBottom(bottom)
             elif self.current_action == 'MOVE':
                 dy = y - self.drag_start_y
                 current_h = self.drag_offset_bottom - self.drag_offset_top
-                new_top = self.drag_offset_top + dy
-                new_bottom = new_top + current_h
-                if new_top < 0:
-                    new_top = 0
-                    new_bottom = current_h
-                if new_bottom > self.image_height:
-                    new_bottom = self.image_height
-                    new_top = new_bottom - current_h
-                self.selections[self.active_rect_index].setTop(new_top)
-                self.selections[self.active_rect_index].setBottom(new_bottom)
-
-            self.refresh_overlays()
+                top = self.drag_offset_top + dy
+                bottom = top + current_h
+                if top < 0:
+                    top = 0
+                    bottom = current_h
+                if bottom > self.image_height:
+                    bottom = self.image_height
+                    top = bottom - current_h
+            # 拖過其他選取區時索引會改變
+            self.active_rect_index = self.model.set(self.active_rect_index, top, bottom)
+
+            self.schedule_overlays()
             
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        if not self.pixmap_item: return
+        if self.source_image is None: return
 
         if self.current_action == 'MOVE_OR_SPLIT':
             pos = self.mapToScene(event.pos())
             y = pos.y()
-            rect = self.selections[self.active_rect_index]
-            if rect.top() + 10 < y < rect.bottom() - 10:
-                top_part = QRectF(0, rect.top(), self.image_width, y - rect.top())
-                bottom_part = QRectF(0, y, self.image_width, rect.bottom() - y)
-                del self.selections[self.active_rect_index]
-                self.selections.append(top_part)
-                self.selections.append(bottom_part)
+            top, bottom = self.model.span(self.active_rect_index)
+            if top + 10 < y < bottom - 10:
+                self.model.split(self.active_rect_index, y)
                 self.merge_overlaps()
                 self.refresh_overlays()
                 self.current_action = None
@@ -429,7 +2015,7 @@ class CropCanvas(QGraphicsView):
                 super().mouseReleaseEvent(event)
                 return
 
-        self.selections = [s for s in self.selections if s.height() > 5]
+        self.model.drop_smaller(5)
         self.current_action = None
         self.active_rect_index = -1
         self.merge_overlaps()
@@ -437,21 +2023,7 @@ class CropCanvas(QGraphicsView):
         super().mouseReleaseEvent(event)
 
     def merge_overlaps(self):
-        if not self.selections: return
-        self.selections.sort(key=lambda r: r.top())
-        merged = []
-        if not self.selections: return
-        curr = self.selections[0]
-        for i in range(1, len(self.selections)):
-            next_rect = self.selections[i]
-            if next_rect.top() < curr.bottom():
-                new_bottom = max(curr.bottom(), next_rect.bottom())
-                curr.setBottom(new_bottom)
-            else:
-                merged.append(curr)
-                curr = next_rect
-        merged.append(curr)
-        self.selections = merged
+        self.model.merge()
 
 class AboutDialog(QDialog):
     def __init__(self, parent=None):
@@ -494,6 +2066,86 @@ class AboutDialog(QDialog):
         """)
         layout.addWidget(btn_close)
 
+class MemoryPanel(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("記憶體使用")
+        self.resize(380, 300)
+        layout = QVBoxLayout(self)
+        self.lbl_report = QLabel()
+        self.lbl_report.setTextFormat(Qt.TextFormat.RichText)
+        layout.addWidget(self.lbl_report)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        rows = self.parent().memory_report()
+        total = sum(n for _, n, _ in rows)
+        html = "<table cellspacing='6'>"
+        for label, n, note in rows:
+            html += f"<tr><td>{label}</td><td align='right'><b>{format_bytes(n)}</b></td><td>{note}</td></tr>"
+        html += f"<tr><td><b>合計</b></td><td align='right'><b>{format_bytes(total)}</b></td><td></td></tr></table>"
+        self.lbl_report.setText(html)
+
+# 最近一次各操作的分段耗時 (PROFILER.last)
+class ProfilerPanel(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("效能分析")
+        self.resize(460, 420)
+        layout = QVBoxLayout(self)
+        self.chk_enabled = QCheckBox("記錄各階段耗時")
+        self.chk_enabled.setChecked(PROFILER.enabled)
+        self.chk_enabled.toggled.connect(self.parent().set_profiling)
+        layout.addWidget(self.chk_enabled)
+        self.lbl_report = QLabel()
+        self.lbl_report.setTextFormat(Qt.TextFormat.RichText)
+        self.lbl_report.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setWidget(self.lbl_report)
+        layout.addWidget(scroll)
+        self.lbl_log = QLabel()
+        self.lbl_log.setWordWrap(True)
+        self.lbl_log.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        layout.addWidget(self.lbl_log)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        if not PROFILER.enabled:
+            self.lbl_report.setText("未啟用")
+        elif not PROFILER.last:
+            self.lbl_report.setText("尚無資料")
+        else:
+            html = "<table cellspacing='4'>"
+            for op, entry in reversed(list(PROFILER.last.items())):
+                html += f"<tr><td><b>{op}</b></td><td align='right'><b>{entry['total_ms']:,.1f} ms</b></td></tr>"
+                for stage, ms in sorted(entry["stages_ms"].items(), key=lambda kv: -kv[1]):
+                    html += f"<tr><td>&nbsp;&nbsp;{stage}</td><td align='right'>{ms:,.1f} ms</td></tr>"
+            self.lbl_report.setText(html + "</table>")
+        self.lbl_log.setText(f"記錄檔: {PROFILER.log_path}" if PROFILER.log_path else "")
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -501,13 +2153,55 @@ class MainWindow(QMainWindow):
         self.setWindowTitle(f"蝦皮上架神器 - {APP_VERSION}")
         self.resize(1400, 900)
         self.setAcceptDrops(True)
-        
-        icon_path = resource_path("Azrael_Head.png")
-        if os.path.exists(icon_path):
-            self.setWindowIcon(QIcon(icon_path))
+        # 先套用樣式表再建立元件，每個元件建立時只 polish 一次
+        self.setStyleSheet(build_theme("AzraelDeep")["qss"])
+        # 圖示、背景圖等裝飾與 PIL 在第一次繪製後才載入 (finish_startup)
+        self.first_paint_done = False
+        self.startup_profile = False
             
         self.image_paths = [] 
         self.stitched_image = None
+        budget_mb = int(self.settings.value("cache_budget_mb", CACHE_BUDGET_MB))
+        # 畫面預覽用快速解碼；輸出時才以 LANCZOS 從原圖重新計算
+        self.image_cache = NormalizedImageCache(budget_mb * 1024 * 1024, load_preview_image)
+        self.export_cache = NormalizedImageCache(EXPORT_CACHE_MB * 1024 * 1024)
+        self.stitcher = StitchEngine(self.image_cache)
+        self.source_thumbs = {}
+        self.source_cut_costs = {}  # 來源 key -> 逐列切割成本 (智慧切線)
+        self.source_hashes = {}  # 來源 key -> 圖片簽章 (重複偵測)
+        self.source_sha1s = {}  # 來源 key -> 檔案 sha1 (存檔時沿用，key 含 mtime/大小，清除工作區時不需重置)
+        # 以上三份快取屬於介面執行緒：背景讀圖在鎖內複製一份來計算，完成後由介面執行緒換上新的字典
+        self.source_lock = threading.Lock()
+        self.pending_selections = None
+        self.trim_plan = None  # 目前顯示中的建議刪減 [(y1, y2)] 與建立時的選取區
+        self.trim_plan_layout = None
+        self.decode_workers = max(1, int(self.settings.value("decode_workers", DECODE_WORKERS)))
+        self.encode_workers = max(1, int(self.settings.value("encode_workers", ENCODE_WORKERS)))
+        
+        # 讀圖工作依序執行 (單一執行緒)，拼接引擎不會被兩個工作同時改動。
+        # 輸出另用一個池：它使用長圖的快照與自己的快取 (export_cache)，清空/開啟專案時只需等待可取消的讀圖工作
+        self.job_pool = QThreadPool(self)
+        self.job_pool.setMaxThreadCount(1)
+        self.export_pool = QThreadPool(self)
+        self.export_pool.setMaxThreadCount(1)
+        # 環境變數只影響這次執行，不寫入設定
+        if os.environ.get("SHOPEE_TOOL_PROFILE") == "1" or \
+                str(self.settings.value("profiling", "false")).lower() == "true":
+            self.apply_profiling(True)
+        self.preview_job = None
+        self.export_job = None
+        # 短時間內連續拖入檔案時合併成一次更新
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(50)
+        self.preview_timer.timeout.connect(self.start_preview_job)
+        # 監看列表中的來源檔：被外部程式 (例如 Photoshop) 改動時只重新讀取那一張，刪除時在列表中標示
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self.on_source_file_changed)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(WATCH_DELAY_MS)
+        self.watch_timer.timeout.connect(self.refresh_preview)
         
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
@@ -526,6 +2220,14 @@ class MainWindow(QMainWindow):
         btn_open.setStyleSheet("font-weight: bold; padding: 6px 15px;")
         toolbar_layout.addWidget(btn_open)
         
+        btn_open_project = QPushButton("📁 開啟專案")
+        btn_open_project.clicked.connect(self.open_project_dialog)
+        toolbar_layout.addWidget(btn_open_project)
+        
+        btn_save_project = QPushButton("💾 儲存專案")
+        btn_save_project.clicked.connect(self.save_project_dialog)
+        toolbar_layout.addWidget(btn_save_project)
+        
         toolbar_layout.addStretch() 
         
         btn_theme = QPushButton("🎨 風格設定")
@@ -535,6 +2237,14 @@ class MainWindow(QMainWindow):
         btn_theme.setMenu(menu_theme)
         toolbar_layout.addWidget(btn_theme)
         
+        btn_memory = QPushButton("📊 記憶體")
+        btn_memory.clicked.connect(self.show_memory_panel)
+        toolbar_layout.addWidget(btn_memory)
+
+        btn_profiler = QPushButton("⏱ 效能")
+        btn_profiler.clicked.connect(self.show_profiler_panel)
+        toolbar_layout.addWidget(btn_profiler)
+        
         btn_about = QPushButton("ℹ️ 關於")
         btn_about.clicked.connect(self.show_about)
         toolbar_layout.addWidget(btn_about)
@@ -579,7 +2289,11 @@ class MainWindow(QMainWindow):
         btn_reset_selection.clicked.connect(self.reset_canvas_selection)
         btn_clear = QPushButton("清空圖庫")
         btn_clear.clicked.connect(self.clear_all)
+        btn_smart_select = QPushButton("智慧選取")
+        btn_smart_select.setToolTip("自動移除空白與分隔條")
+        btn_smart_select.clicked.connect(self.smart_select)
         btn_layout.addWidget(btn_reset_selection)
+        btn_layout.addWidget(btn_smart_select)
         btn_layout.addWidget(btn_clear)
         left_layout.addLayout(btn_layout)
         
@@ -600,6 +2314,30 @@ class MainWindow(QMainWindow):
         setting_layout.addWidget(self.txt_prefix_desc)
         setting_layout.addWidget(lbl_prefix_main)
         setting_layout.addWidget(self.txt_prefix_main)
+        
+        # 檔案大小上限 (超過時自動降低 JPEG 品質)
+        size_layout = QHBoxLayout()
+        self.chk_size_limit = QCheckBox("限制單檔大小")
+        self.chk_size_limit.setChecked(str(self.settings.value("size_limit_enabled", "false")).lower() == "true")
+        self.spin_size_limit = QSpinBox()
+        self.spin_size_limit.setRange(100, 20000)
+        self.spin_size_limit.setSingleStep(100)
+        self.spin_size_limit.setSuffix(" KB")
+        self.spin_size_limit.setValue(int(self.settings.value("size_limit_kb", SIZE_LIMIT_KB)))
+        size_layout.addWidget(self.chk_size_limit)
+        size_layout.addWidget(self.spin_size_limit)
+        setting_layout.addLayout(size_layout)
+        self.chk_smart_cuts = QCheckBox("智慧切線 (避開文字/商品)")
+        self.chk_smart_cuts.setToolTip(f"在每 {MAX_SLICE_HEIGHT}px 切點往上 {CUT_SEARCH_WINDOW}px 內找最平坦的位置，張數不變")
+        self.chk_smart_cuts.setChecked(str(self.settings.value("smart_cuts", "false")).lower() == "true" and has_numpy())
+        self.chk_smart_cuts.toggled.connect(self.toggle_smart_cuts)
+        setting_layout.addWidget(self.chk_smart_cuts)
+        self.chk_skip_dups = QCheckBox("略過重複圖片 (不拼接)")
+        self.chk_skip_dups.setToolTip("內容幾乎相同的圖片 (另存檔名、重新壓縮) 一律在列表中標示 ⚠；勾選時只拼接第一張")
+        # 預設只標示不略過：誤判時圖片不會在不知不覺中從輸出消失
+        self.chk_skip_dups.setChecked(str(self.settings.value("skip_duplicates", "false")).lower() == "true")
+        self.chk_skip_dups.toggled.connect(self.toggle_skip_duplicates)
+        setting_layout.addWidget(self.chk_skip_dups)
         left_layout.addWidget(setting_group)
 
         self.status_box = QFrame()
@@ -611,6 +2349,11 @@ class MainWindow(QMainWindow):
         self.lbl_warning = QLabel("")
         self.lbl_warning.setObjectName("WarningLabel")
         sb_layout.addWidget(self.lbl_warning)
+        # 超過張數時出現：第一次按下顯示建議刪除的區段，第二次按下套用
+        self.btn_trim = QPushButton("建議刪減")
+        self.btn_trim.clicked.connect(self.propose_or_apply_trims)
+        self.btn_trim.setVisible(False)
+        sb_layout.addWidget(self.btn_trim)
         left_layout.addWidget(self.status_box)
 
         self.btn_export = QPushButton("2. 輸出描述圖 (裁切)")
@@ -634,7 +2377,7 @@ class MainWindow(QMainWindow):
         info_bar.setObjectName("InfoBar")
         info_layout = QHBoxLayout(info_bar)
         info_layout.setContentsMargins(10, 5, 10, 5)
-        lbl_preview = QLabel("左鍵點擊=分割 | 拖曳=移動/新增 | 右鍵=刪除")
+        lbl_preview = QLabel("左鍵點擊=分割 | 拖曳=移動/新增 | 右鍵=刪除 | Ctrl+滾輪=縮放")
         info_layout.addWidget(lbl_preview)
         center_layout.addWidget(info_bar)
         
@@ -655,6 +2398,7 @@ class MainWindow(QMainWindow):
         self.map_scroll.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         
         self.minimap = MultiColMiniMap()
+        self.minimap.thumbs = self.source_thumbs
         self.map_scroll.setWidget(self.minimap)
         right_layout.addWidget(self.map_scroll)
         
@@ -666,6 +2410,24 @@ class MainWindow(QMainWindow):
 
         self.apply_theme("AzraelDeep")
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            STARTUP_MARKS.append(("first_paint", time.perf_counter()))
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        icon_path = resource_path("Azrael_Head.png")
+        if os.path.exists(icon_path):
+            self.setWindowIcon(QIcon(icon_path))
+        self.canvas.load_decorations()
+        Image.preinit()  # 預先載入 PIL 與常用格式外掛，第一次開圖時不必等待
+        STARTUP_MARKS.append(("deferred_loaded", time.perf_counter()))
+        if self.startup_profile:
+            print(startup_report())
+            QApplication.instance().quit()
+
     def open_file_dialog(self):
         last_dir = self.settings.value("last_open_dir", os.path.expanduser("~"))
         files, _ = QFileDialog.getOpenFileNames(self, "選擇圖片", last_dir, "Images (*.png *.jpg *.jpeg *.webp *.bmp)")
@@ -673,17 +2435,84 @@ class MainWindow(QMainWindow):
             self.settings.setValue("last_open_dir", os.path.dirname(files[0]))
             self.add_images_to_list(files)
 
+    def save_project_dialog(self):
+        if not self.stitched_image or not self.stitcher.table(): return
+        last_dir = self.settings.value("last_project_dir", os.path.expanduser("~"))
+        path, _ = QFileDialog.getSaveFileName(self, "儲存專案", last_dir, f"Azrael 專案 (*{PROJECT_EXT})")
+        if not path: return
+        if not path.lower().endswith(PROJECT_EXT):
+            path += PROJECT_EXT
+        self.settings.setValue("last_project_dir", os.path.dirname(path))
+        selections = [(r.top(), r.bottom()) for r in self.canvas.selections]
+        extra = {"prefix_desc": self.txt_prefix_desc.text(), "prefix_main": self.txt_prefix_main.text()}
+        try:
+            save_project(path, self.stitcher.shown_table, selections, extra, self.source_sha1s)
+            self.lbl_stats.setText(f"專案已儲存\n{os.path.basename(path)}")
+        except Exception as e:
+            QMessageBox.critical(self, "存檔錯誤", str(e))
+
+    def open_project_dialog(self):
+        last_dir = self.settings.value("last_project_dir", os.path.expanduser("~"))
+        path, _ = QFileDialog.getOpenFileName(self, "開啟專案", last_dir, f"Azrael 專案 (*{PROJECT_EXT})")
+        if not path: return
+        self.settings.setValue("last_project_dir", os.path.dirname(path))
+        self.open_project(path)
+
+    def open_project(self, path):
+        try:
+            project = load_project(path)
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"無法開啟專案: {str(e)}")
+            return
+
+        self.reset_workspace()
+        sources = [src for src in project["sources"] if src["key"] is not None]
+        for src in sources:
+            # 驗證通過代表內容與存檔時相同，下次存檔可直接沿用專案內的 sha1
+            if src["valid"] and src["sha1"]:
+                self.source_sha1s[src["key"]] = src["sha1"]
+        for src in sources:
+            item = QListWidgetItem(os.path.basename(src["path"]))
+            item.setData(Qt.ItemDataRole.UserRole, src["path"])
+            self.file_list.addItem(item)
+        if "prefix_desc" in project: self.txt_prefix_desc.setText(project["prefix_desc"])
+        if "prefix_main" in project: self.txt_prefix_main.setText(project["prefix_main"])
+        if not sources: return
+
+        if len(sources) == len(project["sources"]) and all(src["valid"] for src in sources):
+            # 所有來源都未變動：直接用專案內的高度建立虛擬長圖並還原選取區，不需先解碼；
+            # 之後的背景讀圖只用來預熱快取與產生縮圖
+            self.stitcher.update([src["key"] for src in sources], [src["height"] for src in sources])
+            self.stitched_image = self.stitcher.image
+            self.canvas.load_image(self.stitched_image, project["selections"])
+            self.stitcher.mark_shown()
+        else:
+            # 有來源變動或遺失：以專案內的偏移表為基準重新對應選取區，只有變動的來源會改為全選
+            self.stitcher.shown_table = [(src["key"] if src["valid"] else src["saved_key"], off, src["height"])
+                                         for src, off in zip(project["sources"], self.project_offsets(project))]
+            self.pending_selections = project["selections"]
+        self.start_preview_job()
+
+    @staticmethod
+    def project_offsets(project):
+        offsets = []
+        y = 0
+        for src in project["sources"]:
+            offsets.append(y)
+            y += src["height"]
+        return offsets
+
     def add_images_to_list(self, files):
+        # 以路徑集合判斷是否已在列表中 (內容重複的圖片由讀圖時的感知雜湊處理)
+        existing = {os.path.normcase(os.path.abspath(self.file_list.item(i).data(Qt.ItemDataRole.UserRole)))
+                    for i in range(self.file_list.count())}
         for f in files:
-            found = False
-            for i in range(self.file_list.count()):
-                if self.file_list.item(i).data(Qt.ItemDataRole.UserRole) == f:
-                    found = True
-                    break
-            if not found:
-                item = QListWidgetItem(os.path.basename(f))
-                item.setData(Qt.ItemDataRole.UserRole, f)
-                self.file_list.addItem(item)
+            norm = os.path.normcase(os.path.abspath(f))
+            if norm in existing: continue
+            existing.add(norm)
+            item = QListWidgetItem(os.path.basename(f))
+            item.setData(Qt.ItemDataRole.UserRole, f)
+            self.file_list.addItem(item)
         self.refresh_preview()
 
     def remove_images(self):
@@ -739,54 +2568,271 @@ class MainWindow(QMainWindow):
         if self.stitched_image:
             self.canvas.reset_to_full_selection()
 
+    # 從目前的選取區中扣除偵測到的單色空白帶/分隔條
+    def smart_select(self):
+        if not self.stitched_image or self.canvas.source_image is None: return
+        if not has_numpy():
+            QMessageBox.warning(self, "提示", "智慧選取需要安裝 numpy (pip install numpy)")
+            return
+        min_gap = int(self.settings.value("smart_min_gap", SMART_MIN_GAP))
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            bands = detect_blank_bands(self.stitched_image, min_gap)
+        finally:
+            QApplication.restoreOverrideCursor()
+        current = [(r.top(), r.bottom()) for r in self.canvas.selections]
+        kept = subtract_intervals(current, bands)
+        self.canvas.selections = [QRectF(0, y1, self.canvas.image_width, y2 - y1) for y1, y2 in kept]
+        self.canvas.refresh_overlays()
+        removed = sum(y2 - y1 for y1, y2 in current) - sum(y2 - y1 for y1, y2 in kept)
+        self.lbl_stats.setText(self.lbl_stats.text() + f"\n智慧選取: 移除 {len(bands)} 段，共 {int(removed)} px")
+
+    def clear_trim_plan(self):
+        if self.trim_plan is None: return
+        self.trim_plan = None
+        self.trim_plan_layout = None
+        self.canvas.show_trims(None)
+        self.btn_trim.setText("建議刪減")
+
+    def propose_or_apply_trims(self):
+        if not self.stitched_image or self.canvas.source_image is None: return
+        if self.trim_plan is not None:
+            trims = self.trim_plan
+            current = [(r.top(), r.bottom()) for r in self.canvas.selections]
+            self.clear_trim_plan()
+            kept = subtract_intervals(current, trims)
+            self.canvas.selections = [QRectF(0, y1, self.canvas.image_width, y2 - y1) for y1, y2 in kept]
+            self.canvas.refresh_overlays()
+            return
+        if not has_numpy():
+            QMessageBox.warning(self, "提示", "自動刪減需要安裝 numpy (pip install numpy)")
+            return
+        current = [(r.top(), r.bottom()) for r in self.canvas.selections]
+        excess = math.ceil(sum(y2 - y1 for y1, y2 in current) - MAX_IMAGES * MAX_SLICE_HEIGHT)
+        if excess <= 0: return
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            # 細節分數與智慧切線共用同一份逐列成本；在複本上補算，避免和背景讀圖同時改動同一個字典
+            with self.source_lock:
+                costs = dict(self.source_cut_costs)
+            importance = cut_cost_index(self.stitched_image, costs)
+            with self.source_lock:
+                for key in self.stitched_image.keys:
+                    self.source_cut_costs.setdefault(key, costs[key])
+            trims = plan_trims(current, importance, excess)
+        finally:
+            QApplication.restoreOverrideCursor()
+        if not trims: return
+        self.trim_plan = trims
+        self.trim_plan_layout = current
+        self.canvas.show_trims(trims)
+        self.btn_trim.setText(f"套用刪減 ({len(trims)} 段，共 {sum(y2 - y1 for y1, y2 in trims)} px)")
+
     def clear_all(self):
+        self.reset_workspace()
+        self.image_cache.clear()
+        with self.source_lock:
+            self.source_thumbs.clear()
+            self.source_cut_costs.clear()
+            self.source_hashes.clear()
+        self.lbl_stats.setText("列表已清空")
+
+    # 清空列表與畫布，但保留以 (路徑, mtime, 大小) 為 key 的快取：重新開啟專案時未變動的來源不必再解碼
+    def reset_workspace(self):
+        self.preview_timer.stop()
+        if self.preview_job:
+            self.preview_job.cancel()
+            self.preview_job = None
+        self.job_pool.waitForDone()
+        self.watch_timer.stop()
         self.file_list.clear()
-        self.canvas.scene.clear()
+        self.watch_sources([])
+        self.stitcher.reset()
+        self.clear_trim_plan()
+        self.canvas.cut_cost = None
+        self.pending_selections = None
+        self.stitched_image = None
+        self.canvas.clear_image()
         self.minimap.update_data(None, [])
-        self.lbl_stats.setText("列表已清空")
 
     def refresh_preview(self):
         if self.file_list.count() == 0: 
             return
+        self.preview_timer.start()
+
+    # 監看清單與列表同步；另存時先刪再建的檔案會從監看中消失，重新讀圖前再加回來
+    def watch_sources(self, paths):
+        wanted = {p for p in paths if os.path.exists(p)}
+        watched = set(self.file_watcher.files())
+        if watched - wanted:
+            self.file_watcher.removePaths(list(watched - wanted))
+        if wanted - watched:
+            self.file_watcher.addPaths(list(wanted - watched))
+
+    def on_source_file_changed(self, path):
+        # 存檔通常分好幾次寫入，停止變動一段時間後才重新讀圖；未變動的來源由快取提供
+        self.watch_timer.start()
+
+    def start_preview_job(self):
+        if self.preview_job:
+            self.preview_job.cancel()
+        paths = [self.file_list.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.file_list.count())]
+        self.watch_sources(paths)
+        job = BackgroundJob(self.build_preview, paths, self.chk_smart_cuts.isChecked(), self.chk_skip_dups.isChecked())
+        PROFILER.begin("preview")
+        job.signals.progress.connect(lambda done, total, name, job=job: self.on_preview_progress(job, done, total, name))
+        job.signals.finished.connect(lambda img, job=job: self.on_preview_finished(job, img))
+        job.signals.failed.connect(lambda msg, job=job: self.on_preview_failed(job, msg))
+        self.preview_job = job
+        self.job_pool.start(job)
+
+    # 於背景執行緒執行：讀圖 (經由快取) 並拼接
+    def build_preview(self, job, paths, smart_cuts=False, skip_dups=False):
+        job.missing = {os.path.abspath(p) for p in paths if not os.path.exists(p)}
+        with PROFILER.span("preview", "decode"):
+            decoded = decode_sources(self.image_cache, paths, self.decode_workers, job.report)
+        if not decoded: return None
+        key_set = {key for key, _ in decoded}
+        with self.source_lock:
+            thumbs, cut_costs, hashes = ({k: v for k, v in cache.items() if k in key_set}
+                                         for cache in (self.source_thumbs, self.source_cut_costs, self.source_hashes))
+        with PROFILER.span("preview", "thumbs"):
+            for key, img in decoded:
+                if key not in thumbs:
+                    thumbs[key] = make_source_thumb(img)
+                if key not in hashes:
+                    hashes[key] = image_signature(img)
+
+        # 近似重複：保留列表中第一張，其餘標示 (可選擇不拼接)；job.duplicates 為 路徑 -> 相同的那一張路徑
+        index = ImageHashIndex()
+        job.duplicates = {}
+        unique = []
+        with PROFILER.span("preview", "dedupe"):
+            for key, img in decoded:
+                same = index.find(hashes[key], img.height)
+                if same is None:
+                    index.add(key, hashes[key], img.height)
+                    unique.append((key, img))
+                else:
+                    job.duplicates[key[0]] = same[0]
+                    if not skip_dups:
+                        unique.append((key, img))
+        decoded = unique
+        keys = [key for key, _ in decoded]
+        processed_imgs = [img for _, img in decoded]
+        if smart_cuts:
+            # 切割成本以預覽圖計算 (座標與輸出相同)，每個來源只算一次
+            with PROFILER.span("preview", "cut_cost"):
+                for key, img in decoded:
+                    if key not in cut_costs:
+                        cut_costs[key] = row_cut_cost(img)
+        job.source_caches = (thumbs, cut_costs, hashes)
+        # 解碼完成後才更新偏移表，確保偏移表與長圖一致
+        with PROFILER.span("preview", "stitch"):
+            self.stitcher.update(keys, [img.height for img in processed_imgs])
+        return self.stitcher.image
+
+    def current_cut_cost(self):
+        if not self.chk_smart_cuts.isChecked() or self.stitched_image is None: return None
+        keys = self.stitched_image.keys
+        if any(key not in self.source_cut_costs for key in keys): return None
+        import numpy as np
+        return np.concatenate([self.source_cut_costs[key] for key in keys])
+
+    def toggle_smart_cuts(self, checked):
+        if checked and not has_numpy():
+            QMessageBox.warning(self, "提示", "智慧切線需要安裝 numpy (pip install numpy)")
+            self.chk_smart_cuts.setChecked(False)
+            return
+        self.settings.setValue("smart_cuts", checked)
+        if not checked:
+            self.canvas.set_cut_cost(None)
+        elif self.stitched_image:
+            # 由背景工作補算缺少的切割成本，完成後更新分割線
+            self.start_preview_job()
+
+    def flag_sources(self, duplicates, missing):
+        skipped = self.chk_skip_dups.isChecked()
+        for i in range(self.file_list.count()):
+            item = self.file_list.item(i)
+            path = item.data(Qt.ItemDataRole.UserRole)
+            same = duplicates.get(os.path.abspath(path))
+            if os.path.abspath(path) in missing:
+                item.setText(f"✖ {os.path.basename(path)}")
+                item.setToolTip(f"找不到檔案，未拼接\n{path}")
+                item.setForeground(QColor("#E53935"))
+            elif same is None:
+                item.setText(os.path.basename(path))
+                item.setToolTip("")
+                item.setData(Qt.ItemDataRole.ForegroundRole, None)
+            else:
+                item.setText(f"⚠ {os.path.basename(path)}")
+                item.setToolTip(f"與 {os.path.basename(same)} 幾乎相同" + ("，未拼接" if skipped else ""))
+                item.setForeground(QColor("#9E9E9E"))
 
-        try:
-            processed_imgs = []
-            for i in range(self.file_list.count()):
-                path = self.file_list.item(i).data(Qt.ItemDataRole.UserRole)
-                if not path or not os.path.exists(path): continue
-                
-                img = Image.open(path)
-                if img.mode != "RGB":
-                    img = img.convert("RGB")
-                w, h = img.size
-                scale = TARGET_WIDTH / w
-                new_h = int(h * scale)
-                img = img.resize((TARGET_WIDTH, new_h), Image.Resampling.LANCZOS)
-                processed_imgs.append(img)
-            
-            if not processed_imgs: return
-
-            total_h = sum(img.height for img in processed_imgs)
-            self.stitched_image = Image.new("RGB", (TARGET_WIDTH, total_h), (255, 255, 255))
-            y_offset = 0
-            for img in processed_imgs:
-                self.stitched_image.paste(img, (0, y_offset))
-                y_offset += img.height
-            
-            self.canvas.load_image(self.stitched_image)
-            
-            ideal_width = self.minimap.get_ideal_width()
-            total_w = self.width()
-            target_right_w = ideal_width
-            if target_right_w > total_w * 0.4:
-                 target_right_w = int(total_w * 0.4)
-            self.splitter.setSizes([total_w - target_right_w, target_right_w])
-            
-        except Exception as e:
-            QMessageBox.critical(self, "錯誤", f"處理失敗: {str(e)}")
+    def toggle_skip_duplicates(self, checked):
+        self.settings.setValue("skip_duplicates", checked)
+        self.refresh_preview()
 
-    def update_stats(self, total_height, selections_coords):
-        sel_tuples = [(r.top(), r.bottom()) for r in selections_coords]
+    def on_preview_progress(self, job, done, total, name):
+        if job is not self.preview_job: return
+        self.lbl_stats.setText(f"讀取中 {done + 1}/{total}\n{name}")
+
+    def on_preview_finished(self, job, image):
+        # 已有較新的請求在排隊時略過，由最新一次的結果更新畫面
+        if job is not self.preview_job: return
+        self.preview_job = None
+        caches = getattr(job, "source_caches", None)
+        if caches is not None:
+            with self.source_lock:
+                self.source_thumbs, self.source_cut_costs, self.source_hashes = caches
+            self.minimap.thumbs = self.source_thumbs
+        with PROFILER.span("preview", "show"):
+            self.show_preview(job, image)
+        PROFILER.end("preview", sources=self.file_list.count(),
+                     height=self.stitched_image.height if self.stitched_image else 0)
+
+    def show_preview(self, job, image):
+        self.flag_sources(getattr(job, "duplicates", {}), getattr(job, "missing", set()))
+        if image is None: return
+        if not self.stitcher.is_dirty():
+            if self.minimap.incomplete:
+                self.minimap.set_image(self.stitched_image)
+            self.canvas.set_cut_cost(self.current_cut_cost())
+            self.canvas.refresh_overlays()
+            return
+        self.stitched_image = image
+        self.clear_trim_plan()
+        self.canvas.cut_cost = self.current_cut_cost()
+        
+        # 選取區依偏移表重新對應，不再每次重置為全選 (開啟專案時改用專案內的選取區)
+        if self.pending_selections is not None:
+            old_sel = self.pending_selections
+            self.pending_selections = None
+        else:
+            old_sel = [(r.top(), r.bottom()) for r in self.canvas.selections]
+        selections = self.stitcher.remap_intervals(old_sel)
+        changed_y = self.stitcher.first_change()
+        if self.canvas.source_image is not None and changed_y is not None:
+            # 變動處以上的分塊沿用，之後的來源與選取區依新的偏移表接上
+            self.canvas.replace_image(self.stitched_image, selections, changed_y)
+        else:
+            self.canvas.load_image(self.stitched_image, selections)
+        self.stitcher.mark_shown()
+        
+        ideal_width = self.minimap.get_ideal_width()
+        total_w = self.width()
+        target_right_w = ideal_width
+        if target_right_w > total_w * 0.4:
+             target_right_w = int(total_w * 0.4)
+        self.splitter.setSizes([total_w - target_right_w, target_right_w])
+
+    def on_preview_failed(self, job, msg):
+        if job is not self.preview_job: return
+        self.preview_job = None
+        QMessageBox.critical(self, "錯誤", f"處理失敗: {msg}")
+
+    def update_stats(self, total_height, sel_tuples):
         self.minimap.update_data(self.stitched_image, sel_tuples)
         
         num_images = math.ceil(total_height / MAX_SLICE_HEIGHT)
@@ -798,16 +2844,22 @@ class MainWindow(QMainWindow):
             excess_pixels = int(total_height) - max_allowed_h
             self.lbl_warning.setText(f"⚠️ 超過 {MAX_IMAGES} 張！\n需刪減高度: 約 {excess_pixels} px")
             self.btn_export.setEnabled(False)
+            # 選取區被改動後，舊的建議已不適用
+            if self.trim_plan is not None and sel_tuples != self.trim_plan_layout:
+                self.clear_trim_plan()
+            self.btn_trim.setVisible(True)
         else:
             self.lbl_warning.setText(f"✅ 符合限制")
-            self.btn_export.setEnabled(True)
+            self.btn_export.setEnabled(self.export_job is None)
+            self.clear_trim_plan()
+            self.btn_trim.setVisible(False)
 
     def resizeEvent(self, event):
         self.minimap.adjust_size_request()
         super().resizeEvent(event)
 
     def export_images(self):
-        if not self.stitched_image: return
+        if not self.stitched_image or self.export_job: return
         self.settings.setValue("prefix_desc", self.txt_prefix_desc.text())
         
         last_export_dir = self.settings.value("last_export_dir", os.path.expanduser("~"))
@@ -821,42 +2873,13 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "提示", "沒有選取任何範圍！")
             return
             
-        chunks = []
-        for rect in selections:
-            y1, y2 = int(rect.top()), int(rect.bottom())
-            if y2 > y1:
-                chunk = self.stitched_image.crop((0, y1, TARGET_WIDTH, y2))
-                chunks.append(chunk)
-        
-        if not chunks: return
-        final_h = sum(c.height for c in chunks)
-        final_long_img = Image.new("RGB", (TARGET_WIDTH, final_h))
-        curr_y = 0
-        for c in chunks:
-            final_long_img.paste(c, (0, curr_y))
-            curr_y += c.height
-            
-        idx = 1
-        curr_y = 0
+        intervals = [(r.top(), r.bottom()) for r in selections]
         prefix = self.txt_prefix_desc.text().strip() or "Shopee"
-        
-        try:
-            while curr_y < final_h:
-                cut_h = min(MAX_SLICE_HEIGHT, final_h - curr_y)
-                piece = final_long_img.crop((0, curr_y, TARGET_WIDTH, curr_y + cut_h))
-                
-                filename = f"{prefix}_{idx:02d}.jpg"
-                save_path = get_unique_filename(output_dir, filename)
-                
-                piece.save(save_path, "JPEG", quality=95)
-                curr_y += cut_h
-                idx += 1
-            QMessageBox.information(self, "完成", f"成功輸出 {idx-1} 張圖片！")
-        except Exception as e:
-            QMessageBox.critical(self, "存檔錯誤", str(e))
+        self.start_export_job(export_sliced, intervals, output_dir, prefix, "成功輸出 {} 張圖片！",
+                              cuts=self.canvas.slice_cuts())
 
     def export_selections_raw(self):
-        if not self.stitched_image: return
+        if not self.stitched_image or self.export_job: return
         self.settings.setValue("prefix_main", self.txt_prefix_main.text())
         
         last_export_dir = self.settings.value("last_export_dir", os.path.expanduser("~"))
@@ -870,131 +2893,251 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "提示", "沒有選取任何範圍！")
             return
 
+        intervals = [(r.top(), r.bottom()) for r in selections]
         prefix = self.txt_prefix_main.text().strip() or "Main"
-        idx = 1
-        try:
-            for rect in selections:
-                y1, y2 = int(rect.top()), int(rect.bottom())
-                if y2 > y1:
-                    chunk = self.stitched_image.crop((0, y1, TARGET_WIDTH, y2))
-                    
-                    filename = f"{prefix}_{idx:02d}.jpg"
-                    save_path = get_unique_filename(output_dir, filename)
-                    
-                    chunk.save(save_path, "JPEG", quality=95)
-                    idx += 1
-                    
-            QMessageBox.information(self, "完成", f"成功輸出 {idx-1} 張主圖區塊！")
-        except Exception as e:
-            QMessageBox.critical(self, "存檔錯誤", str(e))
+        self.start_export_job(export_raw, intervals, output_dir, prefix, "成功輸出 {} 張主圖區塊！")
+
+    def start_export_job(self, export_fn, intervals, output_dir, prefix, done_msg, **options):
+        stitched = self.stitched_image.with_cache(self.export_cache)
+        workers = self.encode_workers
+        self.settings.setValue("size_limit_enabled", self.chk_size_limit.isChecked())
+        self.settings.setValue("size_limit_kb", self.spin_size_limit.value())
+        max_bytes = self.spin_size_limit.value() * 1024 if self.chk_size_limit.isChecked() else None
+        try_444 = str(self.settings.value("size_limit_444", "false")).lower() == "true"
+        job = BackgroundJob(lambda job: export_fn(stitched, intervals, output_dir, prefix, job.report, workers,
+                                                  max_bytes, try_444, **options))
+        job.signals.progress.connect(lambda done, total, name: self.lbl_stats.setText(f"輸出中 {done + 1}/{total}\n{name}"))
+        job.signals.finished.connect(lambda result: self.on_export_finished(result, done_msg))
+        job.signals.failed.connect(self.on_export_failed)
+        self.export_job = job
+        self.btn_export.setEnabled(False)
+        self.btn_export_raw.setEnabled(False)
+        self.export_pool.start(job)
+
+    def end_export_job(self):
+        self.export_job = None
+        self.export_cache.clear()
+        self.btn_export_raw.setEnabled(True)
+        self.canvas.refresh_overlays()
+
+    def on_export_finished(self, result, done_msg):
+        self.end_export_job()
+        msg = done_msg.format(len(result["saved"]))
+        if self.chk_size_limit.isChecked() and result["info"]:
+            lines = "\n".join(f"{name}  品質 {quality}  {size / 1024:,.0f} KB" + ("" if fits else "  ⚠️ 仍超過上限")
+                              for name, quality, size, fits in result["info"])
+            msg = f"{msg}\n\n{lines}"
+        if result["errors"]:
+            lines = "\n".join(f"{name}: {err}" for name, err in result["errors"])
+            QMessageBox.warning(self, "部分失敗", f"{msg}\n\n{len(result['errors'])} 個檔案存檔失敗：\n{lines}")
+        else:
+            QMessageBox.information(self, "完成", msg)
+
+    def on_export_failed(self, msg):
+        self.end_export_job()
+        QMessageBox.critical(self, "存檔錯誤", msg)
+
+    def closeEvent(self, event):
+        self.preview_timer.stop()
+        if self.preview_job:
+            self.preview_job.cancel()
+        self.job_pool.waitForDone()
+        self.export_pool.waitForDone()
+        super().closeEvent(event)
+
+    # 各項資料實際佔用的記憶體：(名稱, 位元組數, 說明)
+    def memory_report(self):
+        rows = []
+        stitched = self.stitched_image
+        if stitched is not None:
+            w, h = stitched.size
+            rows.append(("拼接長圖", 0, f"虛擬長圖，實體化需 {format_bytes(w * h * 3)}"))
+        rows.append(("預覽快取", self.image_cache.used_bytes,
+                     f"{len(self.image_cache)} 張 / 上限 {format_bytes(self.image_cache.budget_bytes)}"))
+        rows.append(("輸出快取", self.export_cache.used_bytes, f"{len(self.export_cache)} 張"))
+        tiles = self.canvas.tile_cache.values()
+        rows.append(("畫布分塊 pixmap", sum(pixmap_bytes(p) for p in tiles), f"{len(self.canvas.tile_cache)} 塊"))
+        thumbs = list(self.source_thumbs.values())
+        rows.append(("縮圖 pixmap", pixmap_bytes(self.minimap.image), ""))
+        rows.append(("來源縮圖", sum(NormalizedImageCache.image_bytes(t) for t in thumbs), f"{len(thumbs)} 張"))
+        return rows
+
+    def show_memory_panel(self):
+        if not hasattr(self, "memory_panel"):
+            self.memory_panel = MemoryPanel(self)
+        self.memory_panel.show()
+        self.memory_panel.raise_()
+
+    def show_profiler_panel(self):
+        if not hasattr(self, "profiler_panel"):
+            self.profiler_panel = ProfilerPanel(self)
+        self.profiler_panel.show()
+        self.profiler_panel.raise_()
+
+    # 效能記錄：預設關閉；可由面板切換或以環境變數 SHOPEE_TOOL_PROFILE=1 啟動時開啟
+    # 面板上切換：記住選擇
+    def set_profiling(self, enabled):
+        self.settings.setValue("profiling", enabled)
+        self.apply_profiling(enabled)
+
+    def apply_profiling(self, enabled):
+        if enabled:
+            log_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppLocalDataLocation)
+            PROFILER.enable(os.path.join(log_dir or os.path.expanduser("~"), "profile.jsonl"))
+        else:
+            PROFILER.disable()
 
     def show_about(self):
         dlg = AboutDialog(self)
         dlg.exec()
 
     def apply_theme(self, theme_name):
-        common_font = "font-family: 'Segoe UI', 'Microsoft JhengHei', sans-serif;"
-        
-        if theme_name == "AzraelDeep":
-            bg_dark = "#1a1a1a"
-            bg_panel = "#263238"
-            accent_dark = "#880e4f" 
-            accent_light = "#c2185b" 
-            highlight = "#f06292" 
-            text_main = "#fce4ec" 
+        theme = build_theme(theme_name)
+        # 相同樣式表不重新套用 (重新套用會讓所有元件重新 polish)
+        if self.styleSheet() != theme["qss"]:
+            self.setStyleSheet(theme["qss"])
+        self.canvas.setBackgroundBrush(QBrush(QColor(theme["canvas_bg"])))
+        self.minimap.setStyleSheet(f"background-color: {theme['minimap_bg']};")
+        self.canvas.border_color = QColor(theme["border"])
+        self.canvas.split_line_color = QColor(theme["split"])
+        self.canvas.refresh_overlays()
+
+# --- 啟動耗時報告 (python shopee_tool.py --startup-profile) ---
+def startup_report():
+    lines = ["startup profile (ms)"]
+    t0 = STARTUP_MARKS[0][1]
+    prev = t0
+    for name, t in STARTUP_MARKS[1:]:
+        lines.append(f"  {name:<16s} +{(t - prev) * 1000:7.1f}  ={(t - t0) * 1000:7.1f}")
+        prev = t
+    first = dict(STARTUP_MARKS).get("first_paint")
+    if first is not None:
+        lines.append(f"time to first frame: {(first - t0) * 1000:.1f} ms (不含 Python 直譯器本身的啟動)")
+    return "\n".join(lines)
+
+# --- 主題樣式表：組好的字串依主題快取，重複切換或啟動時不必重組 ---
+THEME_CACHE = {}
+
+def build_theme(theme_name):
+    if theme_name in THEME_CACHE:
+        return THEME_CACHE[theme_name]
+    common_font = "font-family: 'Segoe UI', 'Microsoft JhengHei', sans-serif;"
+    
+    if theme_name == "AzraelDeep":
+        bg_dark = "#1a1a1a"
+        bg_panel = "#263238"
+        accent_dark = "#880e4f" 
+        accent_light = "#c2185b" 
+        highlight = "#f06292" 
+        text_main = "#fce4ec" 
+        
+        qss = f"""
+            QMainWindow {{ background-color: {bg_dark}; color: {text_main}; {common_font} }}
+            QWidget {{ color: {text_main}; {common_font} }}
+            QFrame#Toolbar, QFrame#LeftPanel, QWidget#RightPanel {{ background-color: {bg_panel}; border: none; }}
+            QFrame#InfoBar {{ background-color: {accent_dark}; color: white; }}
+            
+            QPushButton {{ background-color: {accent_dark}; color: white; border: none; padding: 6px; border-radius: 4px; }}
+            QPushButton:hover {{ background-color: {accent_light}; }}
+            
+            QListWidget {{ background-color: #37474f; border: 1px solid #455a64; color: #eceff1; }}
+            QListWidget::item:selected {{ background-color: {accent_light}; color: white; }}
+            
+            QSplitter::handle {{ background-color: #455a64; }}
+            
+            QFrame#StatusBox {{ background-color: #37474f; border: 1px solid {accent_light}; border-radius: 5px; }}
+            QLabel#WarningLabel {{ color: #ff80ab; font-weight: bold; }}
+            
+            QLineEdit {{ background-color: #37474f; border: 1px solid #455a64; color: #eceff1; padding: 3px; }}
+            
+            QPushButton#ExportBtn {{ background-color: {accent_light}; font-size: 14px; font-weight: bold; padding: 8px; }}
+            QPushButton#ExportBtn:hover {{ background-color: {highlight}; }}
+            QPushButton#ExportBtn:disabled {{ background-color: #546e7a; color: #90a4ae; }}
+
+            QPushButton#ExportBtnRaw {{ background-color: #00897b; color: white; font-size: 14px; font-weight: bold; padding: 8px; }}
+            QPushButton#ExportBtnRaw:hover {{ background-color: #26a69a; }}
+
+            QMenu {{ background-color: {bg_panel}; border: 1px solid #455a64; color: {text_main}; }}
+            QMenu::item {{ padding: 5px 20px; }}
+            QMenu::item:selected {{ background-color: {accent_light}; color: white; }}
+            
+            QMessageBox {{ background-color: {bg_panel}; color: {text_main}; }}
+            QMessageBox QLabel {{ color: {text_main}; }}
+        """
+        theme = {"canvas_bg": "#101010", "minimap_bg": bg_dark, "border": highlight, "split": "#ffeb3b"}
+        
+    elif theme_name == "AzraelPale":
+        bg_light = "#fce4ec" 
+        bg_panel = "#f8bbd0" 
+        accent = "#ec407a" 
+        accent_hover = "#d81b60" 
+        text_main = "#4a148c" 
+        
+        qss = f"""
+            QMainWindow {{ background-color: {bg_light}; color: {text_main}; {common_font} }}
+            QWidget {{ color: {text_main}; {common_font} }}
+            QFrame#Toolbar, QFrame#LeftPanel, QWidget#RightPanel {{ background-color: white; border: 1px solid #f48fb1; }}
+            QFrame#InfoBar {{ background-color: {bg_panel}; color: {text_main}; }}
+            
+            QPushButton {{ background-color: {bg_panel}; color: {text_main}; border: 1px solid {accent}; padding: 6px; border-radius: 4px; }}
+            QPushButton:hover {{ background-color: {accent}; color: white; }}
+            
+            QListWidget {{ background-color: white; border: 1px solid {accent}; color: {text_main}; }}
+            QListWidget::item:selected {{ background-color: {accent}; color: white; }}
+            
+            QSplitter::handle {{ background-color: {accent}; }}
             
-            qss = f"""
-                QMainWindow {{ background-color: {bg_dark}; color: {text_main}; {common_font} }}
-                QWidget {{ color: {text_main}; {common_font} }}
-                QFrame#Toolbar, QFrame#LeftPanel, QWidget#RightPanel {{ background-color: {bg_panel}; border: none; }}
-                QFrame#InfoBar {{ background-color: {accent_dark}; color: white; }}
-                
-                QPushButton {{ background-color: {accent_dark}; color: white; border: none; padding: 6px; border-radius: 4px; }}
-                QPushButton:hover {{ background-color: {accent_light}; }}
-                
-                QListWidget {{ background-color: #37474f; border: 1px solid #455a64; color: #eceff1; }}
-                QListWidget::item:selected {{ background-color: {accent_light}; color: white; }}
-                
-                QSplitter::handle {{ background-color: #455a64; }}
-                
-                QFrame#StatusBox {{ background-color: #37474f; border: 1px solid {accent_light}; border-radius: 5px; }}
-                QLabel#WarningLabel {{ color: #ff80ab; font-weight: bold; }}
-                
-                QLineEdit {{ background-color: #37474f; border: 1px solid #455a64; color: #eceff1; padding: 3px; }}
-                
-                QPushButton#ExportBtn {{ background-color: {accent_light}; font-size: 14px; font-weight: bold; padding: 8px; }}
-                QPushButton#ExportBtn:hover {{ background-color: {highlight}; }}
-                QPushButton#ExportBtn:disabled {{ background-color: #546e7a; color: #90a4ae; }}
-
-                QPushButton#ExportBtnRaw {{ background-color: #00897b; color: white; font-size: 14px; font-weight: bold; padding: 8px; }}
-                QPushButton#ExportBtnRaw:hover {{ background-color: #26a69a; }}
-
-                QMenu {{ background-color: {bg_panel}; border: 1px solid #455a64; color: {text_main}; }}
-                QMenu::item {{ padding: 5px 20px; }}
-                QMenu::item:selected {{ background-color: {accent_light}; color: white; }}
-                
-                QMessageBox {{ background-color: {bg_panel}; color: {text_main}; }}
-                QMessageBox QLabel {{ color: {text_main}; }}
-            """
-            self.canvas.setBackgroundBrush(QBrush(QColor("#101010")))
-            self.minimap.setStyleSheet(f"background-color: {bg_dark};")
-            self.canvas.border_color = QColor(highlight)
-            self.canvas.split_line_color = QColor("#ffeb3b")
+            QFrame#StatusBox {{ background-color: #fff; border: 1px solid {accent}; border-radius: 5px; }}
+            QLabel#WarningLabel {{ color: #c2185b; font-weight: bold; }}
             
-        elif theme_name == "AzraelPale":
-            bg_light = "#fce4ec" 
-            bg_panel = "#f8bbd0" 
-            accent = "#ec407a" 
-            accent_hover = "#d81b60" 
-            text_main = "#4a148c" 
+            QLineEdit {{ background-color: #fff; border: 1px solid {accent}; color: {text_main}; padding: 3px; }}
+
+            QPushButton#ExportBtn {{ background-color: {accent}; color: white; font-size: 14px; font-weight: bold; padding: 8px; }}
+            QPushButton#ExportBtn:hover {{ background-color: {accent_hover}; }}
+            QPushButton#ExportBtn:disabled {{ background-color: #e0e0e0; color: #9e9e9e; border: none; }}
+
+            QPushButton#ExportBtnRaw {{ background-color: #26a69a; color: white; font-size: 14px; font-weight: bold; padding: 8px; border: none; }}
+            QPushButton#ExportBtnRaw:hover {{ background-color: #00897b; }}
+
+            QMenu {{ background-color: white; border: 1px solid {accent}; color: {text_main}; }}
+            QMenu::item {{ padding: 5px 20px; }}
+            QMenu::item:selected {{ background-color: {bg_panel}; color: {accent_hover}; }}
             
-            qss = f"""
-                QMainWindow {{ background-color: {bg_light}; color: {text_main}; {common_font} }}
-                QWidget {{ color: {text_main}; {common_font} }}
-                QFrame#Toolbar, QFrame#LeftPanel, QWidget#RightPanel {{ background-color: white; border: 1px solid #f48fb1; }}
-                QFrame#InfoBar {{ background-color: {bg_panel}; color: {text_main}; }}
-                
-                QPushButton {{ background-color: {bg_panel}; color: {text_main}; border: 1px solid {accent}; padding: 6px; border-radius: 4px; }}
-                QPushButton:hover {{ background-color: {accent}; color: white; }}
-                
-                QListWidget {{ background-color: white; border: 1px solid {accent}; color: {text_main}; }}
-                QListWidget::item:selected {{ background-color: {accent}; color: white; }}
-                
-                QSplitter::handle {{ background-color: {accent}; }}
-                
-                QFrame#StatusBox {{ background-color: #fff; border: 1px solid {accent}; border-radius: 5px; }}
-                QLabel#WarningLabel {{ color: #c2185b; font-weight: bold; }}
-                
-                QLineEdit {{ background-color: #fff; border: 1px solid {accent}; color: {text_main}; padding: 3px; }}
-
-                QPushButton#ExportBtn {{ background-color: {accent}; color: white; font-size: 14px; font-weight: bold; padding: 8px; }}
-                QPushButton#ExportBtn:hover {{ background-color: {accent_hover}; }}
-                QPushButton#ExportBtn:disabled {{ background-color: #e0e0e0; color: #9e9e9e; border: none; }}
-
-                QPushButton#ExportBtnRaw {{ background-color: #26a69a; color: white; font-size: 14px; font-weight: bold; padding: 8px; border: none; }}
-                QPushButton#ExportBtnRaw:hover {{ background-color: #00897b; }}
-
-                QMenu {{ background-color: white; border: 1px solid {accent}; color: {text_main}; }}
-                QMenu::item {{ padding: 5px 20px; }}
-                QMenu::item:selected {{ background-color: {bg_panel}; color: {accent_hover}; }}
-                
-                QMessageBox {{ background-color: #fff; color: {text_main}; }}
-                QMessageBox QLabel {{ color: {text_main}; }}
-            """
-            self.canvas.setBackgroundBrush(QBrush(QColor("#fff0f5")))
-            self.minimap.setStyleSheet(f"background-color: {bg_light};")
-            self.canvas.border_color = QColor(accent)
-            self.canvas.split_line_color = QColor("#880e4f")
-
-        self.setStyleSheet(qss)
-        self.canvas.refresh_overlays() 
+            QMessageBox {{ background-color: #fff; color: {text_main}; }}
+            QMessageBox QLabel {{ color: {text_main}; }}
+        """
+        theme = {"canvas_bg": "#fff0f5", "minimap_bg": bg_light, "border": accent, "split": "#880e4f"}
+
+    theme["qss"] = qss
+    THEME_CACHE[theme_name] = theme
+    return theme
 
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False):
+        # 打包成 exe 時，批次處理的子行程會重新執行這裡；freeze_support 讓它們進入 worker 而不是開啟介面
+        import multiprocessing
+        multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(main_batch(sys.argv[2:]))
+
+    if "--bench-decode" in sys.argv:
+        # 可指定要測試的執行緒數，例如 --bench-decode 1,2,4,8
+        i = sys.argv.index("--bench-decode")
+        counts = None
+        if i + 1 < len(sys.argv):
+            counts = [int(n) for n in sys.argv[i + 1].split(",") if n.strip()]
+        benchmark_decode(worker_counts=counts)
+        sys.exit(0)
+
     app = QApplication(sys.argv)
     font = app.font()
     font.setPointSize(10)
     app.setFont(font)
+    STARTUP_MARKS.append(("qapplication", time.perf_counter()))
     
     window = MainWindow()
+    window.startup_profile = "--startup-profile" in sys.argv
+    STARTUP_MARKS.append(("main_window", time.perf_counter()))
     window.showMaximized()
+    STARTUP_MARKS.append(("show", time.perf_counter()))
     sys.exit(app.exec())
\ No newline at end of file